@@ -0,0 +1,215 @@
+"""
+Admission control and rate limiting for DB-bound routes
+
+Independent protections:
+- Token buckets keyed by scanner_id, so a single scanner stuck in a retry
+  loop is throttled without affecting others, and by client address, so a
+  client cannot escape its limit by rotating scanner_id. The client cap is
+  sized for many scanners sharing one NAT address
+- A global in-flight limit sized to the database pool. Status reads are shed
+  once they would take more than their share of it; scan writes may use the
+  whole limit, so under load reads get 429 before writes do
+- A separate small in-flight limit for exports, which hold a slot until the
+  last byte is streamed. Its connections are reserved out of the pool, so
+  long exports never eat into the capacity status reads are admitted against
+
+Both run entirely on the event loop thread and never await while touching
+their state, so no locks are needed and each decision is a few dict lookups
+and float operations.
+"""
+import math
+import os
+import time
+from contextlib import contextmanager
+from enum import Enum
+from typing import Dict, List, Optional
+
+from fastapi import HTTPException, Request
+from sqlalchemy.pool import Pool
+
+from .database import engine
+
+SCANNER_RATE = float(os.getenv("SCANNER_RATE_PER_SEC", "10"))
+SCANNER_BURST = float(os.getenv("SCANNER_BURST", "20"))
+# Twenty scanners at full rate behind one address
+CLIENT_RATE = float(os.getenv("CLIENT_RATE_PER_SEC", "200"))
+CLIENT_BURST = float(os.getenv("CLIENT_BURST", "400"))
+# Behind a proxy or NAT every client shares one peer address; name the header
+# the trusted proxy sets (e.g. X-Forwarded-For) to key the client bucket on it
+CLIENT_IP_HEADER = os.getenv("CLIENT_IP_HEADER", "")
+ADMISSION_READ_SHARE = float(os.getenv("ADMISSION_READ_SHARE", "0.6"))
+EXPORT_MAX_CONCURRENCY = int(os.getenv("EXPORT_MAX_CONCURRENCY", "2"))
+
+# Used when the pool has no fixed size (NullPool/StaticPool, e.g. SQLite)
+DEFAULT_MAX_CONCURRENCY = 15
+
+# Suggested back-off when a request is shed for capacity rather than rate
+SHED_RETRY_AFTER_SECONDS = 1
+
+
+class Priority(str, Enum):
+    READ = "READ"
+    WRITE = "WRITE"
+
+
+class RateLimiter:
+    """
+    Token bucket per key.
+    Each key refills at `rate` tokens/second up to `burst`; a request costs one token.
+    """
+
+    def __init__(self, rate: float, burst: float, max_keys: int = 10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        # key -> [tokens, last refill time]; a list is cheaper to update than an object
+        self._buckets: Dict[str, List[float]] = {}
+
+    def try_acquire(self, key: str, now: Optional[float] = None) -> float:
+        """
+        Take a token for `key`.
+        Returns 0.0 when admitted, otherwise the seconds until a token is available.
+        """
+        if now is None:
+            now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.max_keys:
+                self._evict_idle(now)
+            self._buckets[key] = [self.burst - 1.0, now]
+            return 0.0
+
+        tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        bucket[1] = now
+        if tokens >= 1.0:
+            bucket[0] = tokens - 1.0
+            return 0.0
+        bucket[0] = tokens
+        return (1.0 - tokens) / self.rate
+
+    def _evict_idle(self, now: float):
+        # Buckets that have refilled completely carry no state worth keeping
+        full_after = self.burst / self.rate
+        idle = [k for k, (_, last) in self._buckets.items() if now - last >= full_after]
+        for key in idle:
+            del self._buckets[key]
+        if len(self._buckets) >= self.max_keys:
+            # Still full of active keys: forget the least recently seen
+            oldest = sorted(self._buckets, key=lambda k: self._buckets[k][1])
+            for key in oldest[:len(oldest) // 10 + 1]:
+                del self._buckets[key]
+
+
+class AdmissionController:
+    """
+    Global in-flight limit with priority shedding.
+    Writes are admitted up to max_concurrency; reads only up to read_limit.
+    """
+
+    def __init__(self, max_concurrency: int, read_share: float):
+        self.max_concurrency = max_concurrency
+        self.read_limit = max(1, int(max_concurrency * read_share))
+        self.in_flight = 0
+
+    def try_admit(self, priority: Priority) -> bool:
+        limit = self.max_concurrency if priority == Priority.WRITE else self.read_limit
+        if self.in_flight >= limit:
+            return False
+        self.in_flight += 1
+        return True
+
+    def release(self):
+        self.in_flight -= 1
+
+    @contextmanager
+    def slot(self, priority: Priority):
+        if not self.try_admit(priority):
+            raise HTTPException(
+                status_code=429,
+                detail="Server busy, retry later",
+                headers={"Retry-After": str(SHED_RETRY_AFTER_SECONDS)},
+            )
+        try:
+            yield
+        finally:
+            self.release()
+
+
+def pool_capacity(pool: Pool) -> int:
+    """Connections the pool can hand out at once: pool_size + max_overflow"""
+    size = getattr(pool, "size", None)
+    overflow = getattr(pool, "_max_overflow", None)
+    if not callable(size) or overflow is None or overflow < 0:
+        # No fixed size, or unlimited overflow
+        return DEFAULT_MAX_CONCURRENCY
+    return size() + overflow
+
+
+# Connections not reserved for exports
+ADMISSION_MAX_CONCURRENCY = int(os.getenv("ADMISSION_MAX_CONCURRENCY", "0")) or max(
+    1, pool_capacity(engine.pool) - EXPORT_MAX_CONCURRENCY
+)
+
+scanner_limiter = RateLimiter(SCANNER_RATE, SCANNER_BURST)
+client_limiter = RateLimiter(CLIENT_RATE, CLIENT_BURST)
+admission = AdmissionController(ADMISSION_MAX_CONCURRENCY, ADMISSION_READ_SHARE)
+export_admission = AdmissionController(EXPORT_MAX_CONCURRENCY, read_share=1.0)
+
+
+def _too_many_requests(retry_after: float, detail: str) -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail=detail,
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+    )
+
+
+def client_address(request: Request) -> str:
+    """Client address, from CLIENT_IP_HEADER when configured (first hop)"""
+    if CLIENT_IP_HEADER:
+        forwarded = request.headers.get(CLIENT_IP_HEADER, "").split(",")[0].strip()
+        if forwarded:
+            return forwarded
+    return request.client.host if request.client else "unknown"
+
+
+def check_rate_limits(request: Request):
+    """
+    Apply the per-scanner and per-client buckets; raises 429 when either is empty.
+    scanner_id is client-supplied, so the client bucket is always charged too.
+    """
+    now = time.monotonic()
+    # scanner_id is a query parameter on /scan/* and a path parameter on /scanners/{id}/sync
+    scanner_id = request.path_params.get("scanner_id") or request.query_params.get("scanner_id")
+    if scanner_id:
+        wait = scanner_limiter.try_acquire(scanner_id, now)
+        if wait:
+            raise _too_many_requests(wait, f"Rate limit exceeded for scanner {scanner_id}")
+    wait = client_limiter.try_acquire(client_address(request), now)
+    if wait:
+        raise _too_many_requests(wait, "Rate limit exceeded for client")
+
+
+async def admit_scan_write(request: Request):
+    """Dependency for scan and registration writes: rate limits, then a write slot"""
+    check_rate_limits(request)
+    with admission.slot(Priority.WRITE):
+        yield
+
+
+async def admit_write(request: Request):
+    """Dependency for administrative writes: a write slot, no rate limit"""
+    with admission.slot(Priority.WRITE):
+        yield
+
+
+async def admit_read(request: Request):
+    """Dependency for DB-bound reads; shed first under load"""
+    with admission.slot(Priority.READ):
+        yield
+
+
+async def admit_export(request: Request):
+    """Dependency for exports: a slot from the export limit, held while the response streams"""
+    with export_admission.slot(Priority.READ):
+        yield
@@ -1,8 +1,12 @@
-from typing import List, Optional
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import exists, func
+from sqlalchemy.orm import aliased
 from sqlmodel import select
-from .models import Bag, CheckpointLog, Scanner
+from .models import Bag, CheckpointLog, RejectedScan, Scanner, ScanSyncBatch
 from .database import AsyncSessionLocal
-from .schemas import BagCreate, CheckpointCreate, ScannerCreate
+from .schemas import BagCreate, CheckpointCreate, ScannerCreate, SyncBatch, SyncResult
+from .scan_sync import SyncConflictError, batch_digest, clamp_capture_time
 from sqlmodel.ext.asyncio.session import AsyncSession
 
 async def create_bag(payload: BagCreate) -> Bag:
@@ -55,6 +59,23 @@ async def get_latest_checkpoint(bag_id: str) -> Optional[CheckpointLog]:
         result = await session.execute(q)
         return result.scalar_one_or_none()
 
+async def get_latest_checkpoints(bag_ids: List[str]) -> Dict[str, CheckpointLog]:
+    """Latest checkpoint for each bag in one query, instead of one history load per bag"""
+    if not bag_ids:
+        return {}
+    async with AsyncSessionLocal() as session:
+        ranked = select(
+            CheckpointLog,
+            func.row_number().over(
+                partition_by=CheckpointLog.bag_id,
+                order_by=CheckpointLog.scanned_at.desc()
+            ).label("rn")
+        ).where(CheckpointLog.bag_id.in_(bag_ids)).subquery()
+        latest = aliased(CheckpointLog, ranked)
+        q = select(latest).where(ranked.c.rn == 1)
+        result = await session.execute(q)
+        return {chk.bag_id: chk for chk in result.scalars().all()}
+
 # Scanner CRUD operations
 async def create_scanner(payload: ScannerCreate) -> Scanner:
     async with AsyncSessionLocal() as session:
@@ -77,3 +98,131 @@ async def get_scanners(active_only: bool = True) -> List[Scanner]:
             q = q.where(Scanner.is_active == True)
         result = await session.execute(q)
         return result.scalars().all()
+
+# Offline scanner sync
+# Keep IN (...) lists well below the asyncpg bind-parameter limit
+SYNC_LOOKUP_CHUNK = 1000
+
+async def _sync_marks(session: AsyncSession, scanner_id: str) -> Tuple[Optional[int], Optional[int]]:
+    """
+    (high_water_mark, last_seq) for a scanner.
+    The high-water mark is the end of the contiguous run starting at seq 1,
+    so a device can drop everything <= it even if later batches left a gap.
+    """
+    q = select(func.max(ScanSyncBatch.seq)).where(ScanSyncBatch.scanner_id == scanner_id)
+    last_seq = (await session.execute(q)).scalar_one_or_none()
+    if last_seq is None:
+        return None, None
+
+    q = select(ScanSyncBatch.seq).where(ScanSyncBatch.scanner_id == scanner_id, ScanSyncBatch.seq == 1)
+    if (await session.execute(q)).scalar_one_or_none() is None:
+        return None, last_seq
+
+    # First seq whose successor is missing ends the run from 1
+    following = aliased(ScanSyncBatch)
+    q = select(func.min(ScanSyncBatch.seq)).where(
+        ScanSyncBatch.scanner_id == scanner_id,
+        ~exists().where(
+            following.scanner_id == scanner_id,
+            following.seq == ScanSyncBatch.seq + 1
+        )
+    )
+    return (await session.execute(q)).scalar_one(), last_seq
+
+async def get_sync_state(scanner_id: str) -> SyncResult:
+    async with AsyncSessionLocal() as session:
+        high_water_mark, last_seq = await _sync_marks(session, scanner_id)
+        return SyncResult(scanner_id=scanner_id, high_water_mark=high_water_mark, last_seq=last_seq)
+
+async def apply_sync_batches(scanner: Scanner, batches: List[SyncBatch]) -> SyncResult:
+    """
+    Apply offline batches from one scanner in a single transaction.
+    Batches already recorded for (scanner_id, seq) with the same content are
+    skipped, so a device can safely resend everything it has not seen
+    acknowledged. A known seq with different content raises SyncConflictError
+    and nothing is applied.
+    Scans keep their capture time, which places them correctly in the
+    scanned_at-ordered history. Scans that cannot be applied are stored as
+    RejectedScan rows rather than dropped.
+    """
+    result = SyncResult(scanner_id=scanner.id)
+    received_at = datetime.utcnow()
+
+    digests: Dict[int, str] = {}
+    by_seq: Dict[int, SyncBatch] = {}
+    conflicts = set()
+    for batch in batches:
+        digest = batch_digest(batch)
+        if batch.seq in digests and digests[batch.seq] != digest:
+            conflicts.add(batch.seq)
+        digests[batch.seq] = digest
+        by_seq[batch.seq] = batch
+
+    async with AsyncSessionLocal() as session:
+        try:
+            seqs = list(by_seq)
+            existing: Dict[int, str] = {}
+            for i in range(0, len(seqs), SYNC_LOOKUP_CHUNK):
+                q = select(ScanSyncBatch.seq, ScanSyncBatch.digest).where(
+                    ScanSyncBatch.scanner_id == scanner.id,
+                    ScanSyncBatch.seq.in_(seqs[i:i + SYNC_LOOKUP_CHUNK])
+                )
+                existing.update((await session.execute(q)).all())
+
+            conflicts.update(seq for seq, digest in existing.items() if digests[seq] != digest)
+            if conflicts:
+                raise SyncConflictError(sorted(conflicts))
+
+            pending = [by_seq[seq] for seq in sorted(by_seq) if seq not in existing]
+            result.duplicate_batches = sorted(existing)
+
+            bag_ids = list({scan.bag_id for batch in pending for scan in batch.scans})
+            known_bags = set()
+            for i in range(0, len(bag_ids), SYNC_LOOKUP_CHUNK):
+                q = select(Bag.id).where(Bag.id.in_(bag_ids[i:i + SYNC_LOOKUP_CHUNK]))
+                known_bags.update((await session.execute(q)).scalars().all())
+
+            for batch in pending:
+                applied = 0
+                for scan in sorted(batch.scans, key=lambda s: s.scanned_at):
+                    if scan.bag_id not in known_bags:
+                        session.add(RejectedScan(
+                            scanner_id=scanner.id,
+                            seq=batch.seq,
+                            bag_id=scan.bag_id,
+                            checkpoint=scan.checkpoint,
+                            location=scan.location,
+                            scanned_at=clamp_capture_time(scan.scanned_at, received_at),
+                            status_note=scan.status_note,
+                            reason="Bag not found",
+                            received_at=received_at,
+                        ))
+                        result.rejected_scans += 1
+                        result.errors.append(f"Batch {batch.seq}: bag {scan.bag_id} not found")
+                        continue
+                    session.add(CheckpointLog(
+                        bag_id=scan.bag_id,
+                        checkpoint=scan.checkpoint or scanner.checkpoint,
+                        location=scan.location or scanner.location,
+                        scanner_id=scanner.id,
+                        scanned_at=clamp_capture_time(scan.scanned_at, received_at),
+                        status_note=scan.status_note,
+                    ))
+                    applied += 1
+                session.add(ScanSyncBatch(
+                    scanner_id=scanner.id,
+                    seq=batch.seq,
+                    digest=digests[batch.seq],
+                    scan_count=applied,
+                    received_at=received_at,
+                ))
+                result.applied_batches.append(batch.seq)
+                result.applied_scans += applied
+
+            await session.commit()
+
+            result.high_water_mark, result.last_seq = await _sync_marks(session, scanner.id)
+            return result
+        except Exception:
+            await session.rollback()
+            raise
@@ -0,0 +1,291 @@
+"""
+Streaming export of Bag and CheckpointLog
+
+Rows are read through a server-side cursor and encoded chunk by chunk, so
+peak memory depends on the chunk size rather than on the size of the result.
+Used by the /export endpoints (as a chunked StreamingResponse) and by the CLI:
+
+    python -m app.export checkpoints --format parquet --since 2024-01-01 -o logs.parquet
+    python -m app.export bags --format csv --flight BA123 --stats > bags.csv
+"""
+import argparse
+import asyncio
+import csv
+import io
+import json
+import sys
+import time
+from datetime import datetime, timezone
+from enum import Enum
+from typing import AsyncIterator, Dict, List, Optional
+
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlmodel import select
+
+from .database import engine as default_engine
+from .models import Bag, CheckpointLog, CheckpointStage
+
+DEFAULT_CHUNK_SIZE = 5000
+
+EXPORT_TABLES = {
+    "bags": Bag,
+    "checkpoints": CheckpointLog,
+}
+
+EXPORT_FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+
+def _utc_naive(value: Optional[datetime]) -> Optional[datetime]:
+    # Timestamps are stored as naive UTC
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def build_export_query(
+    table: str,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    flight_number: Optional[str] = None,
+    checkpoint: Optional[CheckpointStage] = None
+):
+    """
+    Build the SELECT for an export.
+    Time filters apply to Bag.registered_at for bags and to
+    CheckpointLog.scanned_at for checkpoints.
+    """
+    model = EXPORT_TABLES[table]
+    q = select(*model.__table__.columns)
+
+    if model is Bag:
+        timestamp = Bag.registered_at
+        if flight_number:
+            q = q.where(Bag.flight_number == flight_number)
+        if checkpoint:
+            raise ValueError("checkpoint filter only applies to checkpoints export")
+    else:
+        timestamp = CheckpointLog.scanned_at
+        if flight_number:
+            q = q.join(Bag, Bag.id == CheckpointLog.bag_id).where(Bag.flight_number == flight_number)
+        if checkpoint:
+            q = q.where(CheckpointLog.checkpoint == checkpoint)
+
+    since, until = _utc_naive(since), _utc_naive(until)
+    if since:
+        q = q.where(timestamp >= since)
+    if until:
+        q = q.where(timestamp < until)
+    return q.order_by(timestamp, model.id)
+
+
+def export_columns(table: str) -> List[str]:
+    return [c.name for c in EXPORT_TABLES[table].__table__.columns]
+
+
+def _plain(value):
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _native(value):
+    # Parquet keeps real timestamps; only enums need unwrapping
+    if isinstance(value, Enum):
+        return value.value
+    return value
+
+
+async def stream_chunks(
+    q,
+    engine: AsyncEngine = default_engine,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    iso_timestamps: bool = True
+) -> AsyncIterator[List[Dict]]:
+    """Yield lists of at most chunk_size row dicts via a server-side cursor"""
+    convert = _plain if iso_timestamps else _native
+    async with engine.connect() as conn:
+        result = await conn.stream(q.execution_options(yield_per=chunk_size))
+        async for partition in result.mappings().partitions(chunk_size):
+            yield [{k: convert(v) for k, v in row.items()} for row in partition]
+
+
+async def encode_csv(chunks: AsyncIterator[List[Dict]], table: str) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=export_columns(table))
+    writer.writeheader()
+    async for chunk in chunks:
+        writer.writerows(chunk)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    # Header only, if there were no rows
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+async def encode_ndjson(chunks: AsyncIterator[List[Dict]], table: str) -> AsyncIterator[bytes]:
+    async for chunk in chunks:
+        yield "".join(json.dumps(row) + "\n" for row in chunk).encode("utf-8")
+
+
+class _DrainableSink(io.RawIOBase):
+    """Write-only file object whose contents are handed out after each row group"""
+
+    def __init__(self):
+        self._parts: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._parts.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts.clear()
+        return data
+
+
+def _arrow_schema(table: str):
+    import pyarrow as pa
+
+    fields = []
+    for column in EXPORT_TABLES[table].__table__.columns:
+        python_type = None
+        try:
+            python_type = column.type.python_type
+        except NotImplementedError:
+            pass
+        if python_type is datetime:
+            arrow_type = pa.timestamp("us")
+        elif python_type is bool:
+            arrow_type = pa.bool_()
+        elif python_type is int:
+            arrow_type = pa.int64()
+        elif python_type is float:
+            arrow_type = pa.float64()
+        else:
+            # Everything else, including enums such as CheckpointLog.checkpoint, is exported as text
+            arrow_type = pa.string()
+        fields.append(pa.field(column.name, arrow_type, nullable=column.nullable))
+    return pa.schema(fields)
+
+
+async def encode_parquet(chunks: AsyncIterator[List[Dict]], table: str) -> AsyncIterator[bytes]:
+    # pyarrow is heavy; only load it when a Parquet export is requested
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _arrow_schema(table)
+    sink = _DrainableSink()
+    writer = pq.ParquetWriter(sink, schema)
+    try:
+        async for chunk in chunks:
+            # One row group per chunk
+            writer.write_table(pa.Table.from_pylist(chunk, schema=schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+ENCODERS = {
+    "csv": encode_csv,
+    "ndjson": encode_ndjson,
+    "parquet": encode_parquet,
+}
+
+
+def stream_export(
+    table: str,
+    fmt: str,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    flight_number: Optional[str] = None,
+    checkpoint: Optional[CheckpointStage] = None,
+    engine: AsyncEngine = default_engine,
+    chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> AsyncIterator[bytes]:
+    """
+    Encoded byte stream for an export.
+    Raises ValueError for invalid filter combinations before any rows are read.
+    """
+    q = build_export_query(table, since, until, flight_number, checkpoint)
+    chunks = stream_chunks(q, engine, chunk_size, iso_timestamps=fmt != "parquet")
+    return ENCODERS[fmt](chunks, table)
+
+
+def peak_rss_mb() -> Optional[float]:
+    # resource is Unix-only; importing it here keeps the API importable on Windows
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+async def run_export(args, out) -> Dict:
+    rows = 0
+    started = time.perf_counter()
+    q = build_export_query(args.table, args.since, args.until, args.flight, args.checkpoint)
+
+    async def counted():
+        nonlocal rows
+        async for chunk in stream_chunks(q, default_engine, args.chunk_size, args.format != "parquet"):
+            rows += len(chunk)
+            yield chunk
+
+    async for data in ENCODERS[args.format](counted(), args.table):
+        out.write(data)
+    await default_engine.dispose()
+
+    elapsed = time.perf_counter() - started
+    rss = peak_rss_mb()
+    return {
+        "rows": rows,
+        "seconds": round(elapsed, 3),
+        "rows_per_second": round(rows / elapsed) if elapsed else None,
+        "peak_rss_mb": round(rss, 1) if rss is not None else None,
+    }
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Stream Bag or CheckpointLog rows to CSV, NDJSON or Parquet")
+    parser.add_argument("table", choices=list(EXPORT_TABLES))
+    parser.add_argument("--format", choices=list(EXPORT_FORMATS), default="csv")
+    parser.add_argument("--since", type=datetime.fromisoformat, default=None)
+    parser.add_argument("--until", type=datetime.fromisoformat, default=None)
+    parser.add_argument("--flight", default=None, help="Filter by flight number")
+    parser.add_argument("--checkpoint", type=CheckpointStage, default=None, choices=list(CheckpointStage))
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("-o", "--output", default=None, help="Output file (default: stdout)")
+    parser.add_argument("--stats", action="store_true", help="Print rows/s and peak RSS to stderr")
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+    if args.output:
+        with open(args.output, "wb") as out:
+            stats = asyncio.run(run_export(args, out))
+    else:
+        stats = asyncio.run(run_export(args, sys.stdout.buffer))
+    if args.stats:
+        print(json.dumps(stats), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
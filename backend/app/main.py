@@ -1,13 +1,20 @@
 ﻿import asyncio
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import Depends, FastAPI, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from sqlalchemy.exc import IntegrityError
+from datetime import datetime
 from typing import List, Optional
 from . import crud, models, schemas
+from .admission import admit_export, admit_read, admit_scan_write, admit_write
 from .database import init_db
+from .export import EXPORT_FORMATS, stream_export
 from .models import CheckpointStage
 from .models import get_next_stage
 from .qrcode_gen import get_qr_code_response
-from .state_derivation import derive_operational_state
+from .scan_sync import SyncConflictError, SyncPayloadError, decode_sync_payload, read_sync_body
+from .search import MIN_QUERY_LENGTH, SearchUnavailableError, search_bags
+from .state_derivation import derive_operational_state, derive_stage_summary
 
 app = FastAPI(
     title="Baggage Tracker",
@@ -29,12 +36,12 @@ async def on_startup():
     # initialize DB (create tables)
     await init_db()
 
-@app.post("/registerBag", response_model=schemas.BagRead)
+@app.post("/registerBag", response_model=schemas.BagRead, dependencies=[Depends(admit_scan_write)])
 async def register_bag(payload: schemas.BagCreate):
     bag = await crud.create_bag(payload)
     return bag
 
-@app.post("/scanCheckpoint", response_model=schemas.CheckpointRead)
+@app.post("/scanCheckpoint", response_model=schemas.CheckpointRead, dependencies=[Depends(admit_scan_write)])
 async def scan_checkpoint(payload: schemas.CheckpointCreate):
     # ensure bag exists
     bag = await crud.get_bag(payload.bag_id)
@@ -43,7 +50,7 @@ async def scan_checkpoint(payload: schemas.CheckpointCreate):
     chk = await crud.add_checkpoint(payload)
     return chk
 
-@app.get("/getStatus/{bag_id}", response_model=schemas.BagStatus)
+@app.get("/getStatus/{bag_id}", response_model=schemas.BagStatus, dependencies=[Depends(admit_read)])
 async def get_status(bag_id: str):
     """
     Get complete bag status including:
@@ -76,6 +83,37 @@ async def get_status(bag_id: str):
         "operational_state": operational_state  # NEW: Derived state interpretation
     }
 
+@app.get("/search", response_model=schemas.SearchResults, dependencies=[Depends(admit_read)])
+async def search(
+    q: str = Query(..., min_length=MIN_QUERY_LENGTH, description="Partial passenger name or tag number"),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page")
+):
+    """
+    Ranked bag search for the service desk.
+    Each hit carries the bag's current derived stage, computed from its
+    latest checkpoint (one query for the whole page).
+    """
+    try:
+        rows, next_cursor = await search_bags(q, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except NotImplementedError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    except SearchUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+    latest = await crud.get_latest_checkpoints([row["id"] for row in rows])
+    hits = []
+    for row in rows:
+        score = row.pop("score")
+        hits.append(schemas.SearchHit(
+            bag=schemas.BagRead(**row),
+            score=score,
+            **derive_stage_summary(latest.get(row["id"]))
+        ))
+    return schemas.SearchResults(hits=hits, next_cursor=next_cursor)
+
 @app.get("/checkpoints", response_model=list[CheckpointStage])
 async def list_checkpoints():
     """
@@ -85,7 +123,7 @@ async def list_checkpoints():
 
 # ========== AUTOMATION ENDPOINTS ==========
 
-@app.get("/bag/{bag_id}/qr", response_class=Response)
+@app.get("/bag/{bag_id}/qr", response_class=Response, dependencies=[Depends(admit_read)])
 async def get_bag_qr_code(bag_id: str):
     """
     Generate QR code for a bag ID.
@@ -96,7 +134,7 @@ async def get_bag_qr_code(bag_id: str):
         raise HTTPException(status_code=404, detail="Bag not found")
     return get_qr_code_response(bag_id)
 
-@app.post("/scan/auto", response_model=schemas.CheckpointRead)
+@app.post("/scan/auto", response_model=schemas.CheckpointRead, dependencies=[Depends(admit_scan_write)])
 async def auto_scan_checkpoint(
     bag_id: str = Query(..., description="Bag ID (from barcode/QR scanner)"),
     scanner_id: Optional[str] = Query(None, description="Scanner device ID"),
@@ -141,7 +179,7 @@ async def auto_scan_checkpoint(
     chk = await crud.add_checkpoint(payload)
     return chk
 
-@app.post("/scan/batch", response_model=List[schemas.CheckpointRead])
+@app.post("/scan/batch", response_model=List[schemas.CheckpointRead], dependencies=[Depends(admit_scan_write)])
 async def batch_scan_checkpoints(
     bag_ids: List[str] = Query(..., description="List of bag IDs"),
     scanner_id: Optional[str] = Query(None, description="Scanner device ID"),
@@ -200,22 +238,110 @@ async def batch_scan_checkpoints(
     
     return results
 
-@app.post("/scanners", response_model=schemas.ScannerRead)
+@app.post("/scanners", response_model=schemas.ScannerRead, dependencies=[Depends(admit_write)])
 async def create_scanner(payload: schemas.ScannerCreate):
     """Register a new scanner device"""
     scanner = await crud.create_scanner(payload)
     return scanner
 
-@app.get("/scanners", response_model=List[schemas.ScannerRead])
+@app.get("/scanners", response_model=List[schemas.ScannerRead], dependencies=[Depends(admit_read)])
 async def list_scanners(active_only: bool = Query(True)):
     """List all scanner devices"""
     scanners = await crud.get_scanners(active_only=active_only)
     return scanners
 
-@app.get("/scanners/{scanner_id}", response_model=schemas.ScannerRead)
+@app.get("/scanners/{scanner_id}", response_model=schemas.ScannerRead, dependencies=[Depends(admit_read)])
 async def get_scanner(scanner_id: str):
     """Get scanner device details"""
     scanner = await crud.get_scanner(scanner_id)
     if not scanner:
         raise HTTPException(status_code=404, detail="Scanner not found")
-    return scanner
\ No newline at end of file
+    return scanner
+
+@app.get("/scanners/{scanner_id}/sync", response_model=schemas.SyncResult, dependencies=[Depends(admit_read)])
+async def get_scanner_sync_state(scanner_id: str):
+    """
+    Get the sync marks for a scanner.
+    Devices call this before numbering new batches so they never reuse a seq.
+    """
+    scanner = await crud.get_scanner(scanner_id)
+    if not scanner:
+        raise HTTPException(status_code=404, detail="Scanner not found")
+    return await crud.get_sync_state(scanner_id)
+
+@app.post("/scanners/{scanner_id}/sync", response_model=schemas.SyncResult, dependencies=[Depends(admit_scan_write)])
+async def sync_scanner(scanner_id: str, request: Request):
+    """
+    Replay scans buffered by a scanner while it was offline.
+    Body is gzip NDJSON (one batch per line) or msgpack (array of batches);
+    each batch is {"seq": int, "scans": [{"bag_id", "scanned_at", ...}]}.
+    Batches are applied idempotently by (scanner_id, seq); a known seq with
+    different content is rejected with 409. The response carries the
+    high-water mark the device can drop its buffer up to.
+    """
+    scanner = await crud.get_scanner(scanner_id)
+    if not scanner:
+        raise HTTPException(status_code=404, detail="Scanner not found")
+    if not scanner.is_active:
+        raise HTTPException(status_code=403, detail="Scanner is inactive")
+
+    try:
+        body = await read_sync_body(request.stream(), request.headers.get("content-length"))
+        batches = decode_sync_payload(
+            body,
+            request.headers.get("content-type"),
+            request.headers.get("content-encoding"),
+        )
+    except SyncPayloadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        return await crud.apply_sync_batches(scanner, batches)
+    except SyncConflictError as e:
+        raise HTTPException(status_code=409, detail={
+            "message": "Batch seq already used with different content",
+            "conflicting_batches": e.seqs,
+        })
+    except IntegrityError:
+        # Another upload from the same device committed the same seq first
+        raise HTTPException(status_code=409, detail="Concurrent sync for this scanner, retry")
+
+
+# ========== EXPORT ENDPOINTS ==========
+
+def _export_response(table: str, fmt: str, since, until, flight_number, checkpoint=None):
+    try:
+        body = stream_export(table, fmt, since, until, flight_number, checkpoint)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    media_type, extension = EXPORT_FORMATS[fmt]
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{table}.{extension}"'},
+    )
+
+@app.get("/export/bags", dependencies=[Depends(admit_export)])
+async def export_bags(
+    format: str = Query("csv", pattern="^(csv|ndjson|parquet)$"),
+    since: Optional[datetime] = Query(None, description="Registered at or after (UTC)"),
+    until: Optional[datetime] = Query(None, description="Registered before (UTC)"),
+    flight_number: Optional[str] = Query(None)
+):
+    """
+    Stream all matching bags as CSV, NDJSON or Parquet.
+    Rows are read through a server-side cursor and sent with chunked encoding,
+    so memory stays flat regardless of result size.
+    """
+    return _export_response("bags", format, since, until, flight_number)
+
+@app.get("/export/checkpoints", dependencies=[Depends(admit_export)])
+async def export_checkpoints(
+    format: str = Query("csv", pattern="^(csv|ndjson|parquet)$"),
+    since: Optional[datetime] = Query(None, description="Scanned at or after (UTC)"),
+    until: Optional[datetime] = Query(None, description="Scanned before (UTC)"),
+    flight_number: Optional[str] = Query(None),
+    checkpoint: Optional[CheckpointStage] = Query(None)
+):
+    """Stream all matching checkpoint logs in scanned_at order as CSV, NDJSON or Parquet"""
+    return _export_response("checkpoints", format, since, until, flight_number, checkpoint)
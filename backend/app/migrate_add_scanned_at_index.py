@@ -0,0 +1,21 @@
+"""
+Migration script to index checkpointlog.scanned_at
+Streaming exports and the replay engine read the log in scanned_at order;
+without the index Postgres sorts the whole table before the first row.
+Run this once on databases created before the index was added
+"""
+import asyncio
+from sqlalchemy import text
+from app.database import engine
+
+async def migrate():
+    async with engine.begin() as conn:
+        print("Creating index ix_checkpointlog_scanned_at (if missing)...")
+        await conn.execute(text("""
+            CREATE INDEX IF NOT EXISTS ix_checkpointlog_scanned_at
+            ON checkpointlog (scanned_at)
+        """))
+        print("Done!")
+
+if __name__ == "__main__":
+    asyncio.run(migrate())
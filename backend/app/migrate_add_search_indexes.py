@@ -0,0 +1,84 @@
+"""
+Migration script to create the indexes behind GET /search
+- PostgreSQL: pg_trgm GIN indexes on bag.tag_number and bag.passenger_name,
+  built with CREATE INDEX CONCURRENTLY so the bag table stays writable
+- SQLite: an FTS5 trigram table over bag, kept in sync by triggers
+Both also add a (bag_id, scanned_at) index on checkpointlog for the
+latest-checkpoint lookup on each page of hits.
+Run this once per database; it is safe to re-run
+"""
+import asyncio
+from sqlalchemy import text
+from app import models  # noqa: F401  registers the tables with SQLModel.metadata
+from app.database import engine, init_db
+
+POSTGRES_INDEXES = {
+    "ix_bag_tag_number_trgm": "bag USING gin (tag_number gin_trgm_ops)",
+    "ix_bag_passenger_name_trgm": "bag USING gin (passenger_name gin_trgm_ops)",
+    "ix_checkpointlog_bag_id_scanned_at": "checkpointlog (bag_id, scanned_at)",
+}
+
+SQLITE_SETUP = [
+    """CREATE VIRTUAL TABLE bag_search USING fts5(
+        bag_id UNINDEXED, tag_number, passenger_name, tokenize='trigram'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS bag_search_ai AFTER INSERT ON bag BEGIN
+        INSERT INTO bag_search (bag_id, tag_number, passenger_name)
+        VALUES (new.id, new.tag_number, new.passenger_name);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS bag_search_au AFTER UPDATE ON bag BEGIN
+        DELETE FROM bag_search WHERE bag_id = old.id;
+        INSERT INTO bag_search (bag_id, tag_number, passenger_name)
+        VALUES (new.id, new.tag_number, new.passenger_name);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS bag_search_ad AFTER DELETE ON bag BEGIN
+        DELETE FROM bag_search WHERE bag_id = old.id;
+    END""",
+    # Index existing bags
+    "INSERT INTO bag_search (bag_id, tag_number, passenger_name) SELECT id, tag_number, passenger_name FROM bag",
+    "CREATE INDEX IF NOT EXISTS ix_checkpointlog_bag_id_scanned_at ON checkpointlog (bag_id, scanned_at)",
+]
+
+async def migrate_postgres():
+    async with engine.connect() as conn:
+        # CONCURRENTLY cannot run inside a transaction block
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        for name, definition in POSTGRES_INDEXES.items():
+            # An interrupted concurrent build leaves an INVALID index that
+            # IF NOT EXISTS would skip; drop it so it is rebuilt
+            invalid = await conn.execute(text("""
+                SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+                WHERE c.relname = :name AND NOT i.indisvalid
+            """), {"name": name})
+            if invalid.first() is not None:
+                print(f"Dropping invalid index {name}...")
+                await conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+            print(f"Creating index {name} (if missing)...")
+            await conn.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {definition}"))
+
+async def migrate_sqlite():
+    async with engine.begin() as conn:
+        exists = await conn.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'bag_search'"
+        ))
+        if exists.first() is not None:
+            print("bag_search already exists, skipping")
+            return
+        print("Creating FTS5 table bag_search and its triggers...")
+        for statement in SQLITE_SETUP:
+            await conn.execute(text(statement))
+
+async def migrate():
+    # The indexes and triggers need the tables; a no-op on existing databases
+    await init_db()
+    if engine.dialect.name == "postgresql":
+        await migrate_postgres()
+    elif engine.dialect.name == "sqlite":
+        await migrate_sqlite()
+    else:
+        raise NotImplementedError(f"Search is not supported on {engine.dialect.name}")
+    print("Done!")
+
+if __name__ == "__main__":
+    asyncio.run(migrate())
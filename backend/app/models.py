@@ -1,4 +1,5 @@
 from typing import Optional
+from sqlalchemy import Enum as SAEnum
 from sqlmodel import SQLModel, Field, Column
 from datetime import datetime
 from uuid import uuid4
@@ -38,14 +39,36 @@ class Scanner(SQLModel, table=True):
 
 class CheckpointLog(SQLModel, table=True):
     id: str = Field(default_factory=lambda: str(uuid4()), primary_key=True)
-    # store as string; SQLModel will store the Enum value text
-    checkpoint: CheckpointStage = Field(sa_column=Column("checkpoint", nullable=False))
+    # same enum column type SQLModel generates for Scanner.checkpoint
+    checkpoint: CheckpointStage = Field(sa_column=Column("checkpoint", SAEnum(CheckpointStage), nullable=False))
     bag_id: str = Field(foreign_key="bag.id")
     location: Optional[str] = None
     scanner_id: Optional[str] = Field(default=None, foreign_key="scanner.id")
-    scanned_at: datetime = Field(default_factory=datetime.utcnow)
+    # indexed so exports and replays can stream in scanned_at order without a sort
+    scanned_at: datetime = Field(default_factory=datetime.utcnow, index=True)
     status_note: Optional[str] = None
 
+class ScanSyncBatch(SQLModel, table=True):
+    # One row per offline batch a scanner has uploaded; (scanner_id, seq) makes replays idempotent
+    scanner_id: str = Field(foreign_key="scanner.id", primary_key=True)
+    seq: int = Field(primary_key=True)
+    digest: str  # sha256 of the batch content, so a reused seq with different scans is detected
+    scan_count: int = 0
+    received_at: datetime = Field(default_factory=datetime.utcnow)
+
+class RejectedScan(SQLModel, table=True):
+    # Offline scans that could not be applied (e.g. unknown bag), kept for reconciliation
+    id: str = Field(default_factory=lambda: str(uuid4()), primary_key=True)
+    scanner_id: str = Field(foreign_key="scanner.id")
+    seq: int
+    bag_id: str
+    checkpoint: Optional[CheckpointStage] = None
+    location: Optional[str] = None
+    scanned_at: datetime
+    status_note: Optional[str] = None
+    reason: str
+    received_at: datetime = Field(default_factory=datetime.utcnow)
+
 def get_next_stage(current_stage: CheckpointStage):
     stages = list(CheckpointStage)
     idx = stages.index(current_stage)
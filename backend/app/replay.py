@@ -0,0 +1,381 @@
+"""
+Historical replay engine for calibrating state-derivation thresholds
+
+Streams CheckpointLog in scanned_at order through a server-side cursor and
+re-derives delay risk at simulated times under candidate DelayThresholds.
+Each bag's risk is evaluated at the moment its next scan arrives (the peak
+of the gap, since risk only grows with time since last scan), and the bag is
+flagged if any gap before its terminal scan reached the flag level.
+
+Flags are scored against actual outcomes:
+- LOST bags are positives; a flagged LOST bag is a true positive
+- CLAIMED bags are negatives; a flagged CLAIMED bag is a false positive
+- Bags still open or RETURNED_TO_AGENT are not scored
+
+Only the last scan of each active bag is kept. Once a bag has been idle for
+longer than the idle horizon, its gap is evaluated up to the horizon and the
+bag goes dormant: only its per-parameter-set flags are kept, a few bytes
+instead of the full state. Gaps are never evaluated past the horizon, so
+results do not depend on when idle bags are swept. A dormant bag that scans
+again resumes its journey with those flags and is counted in resumed_bags;
+one that never reaches an outcome is counted as open. Memory is bounded by
+the bags scanned within the horizon plus a flag vector per unresolved bag.
+A terminal scan for a bag never seen before (its journey started before the
+window) cannot be scored and is counted as unobserved_lost/unobserved_claimed.
+
+Per-bag state is independent, so the log is split by bag across a process
+pool: each worker streams one bag_id range and scores every parameter set on
+it, and the per-worker reports are summed.
+
+Usage:
+    python -m app.replay --medium 1.5 2 2.5 --high 3 4 --scale 0.8 1 1.2 --workers 4
+"""
+import argparse
+import asyncio
+import json
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, asdict, replace
+from datetime import datetime, timedelta
+from itertools import product
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlmodel import select
+
+from .database import DATABASE_URL
+from .models import CheckpointLog, CheckpointStage, get_next_stage
+from .state_derivation import (
+    DEFAULT_THRESHOLDS,
+    DelayThresholds,
+    RiskLevel,
+    assess_delay_minutes,
+    is_terminal_stage,
+)
+
+DEFAULT_CHUNK_SIZE = 5000
+# Bags idle longer than this go dormant; gaps are evaluated up to it
+DEFAULT_IDLE_HORIZON = timedelta(hours=72)
+
+RISK_ORDER = {RiskLevel.LOW: 0, RiskLevel.MEDIUM: 1, RiskLevel.HIGH: 2}
+
+
+@dataclass
+class ReplayReport:
+    """Outcome of replaying the checkpoint history under one DelayThresholds"""
+    thresholds: DelayThresholds
+    alerts: int = 0  # gaps in which risk reached the flag level
+    flagged_lost: int = 0  # true positives
+    missed_lost: int = 0  # false negatives
+    flagged_claimed: int = 0  # false positives
+    clean_claimed: int = 0  # true negatives
+    open_bags: int = 0  # no CLAIMED/LOST outcome by the end of the replay
+    idle_bags: int = 0  # of open_bags, those idle past the horizon at the end
+    resumed_bags: int = 0  # scanned again after being idle past the horizon
+    unobserved_lost: int = 0  # LOST with no earlier scan in the window; not scored
+    unobserved_claimed: int = 0  # CLAIMED with no earlier scan in the window; not scored
+
+    @property
+    def false_positive_rate(self) -> Optional[float]:
+        claimed = self.flagged_claimed + self.clean_claimed
+        return self.flagged_claimed / claimed if claimed else None
+
+    @property
+    def false_negative_rate(self) -> Optional[float]:
+        lost = self.flagged_lost + self.missed_lost
+        return self.missed_lost / lost if lost else None
+
+    def merge(self, other: "ReplayReport"):
+        """Add counts from a report over a different set of bags"""
+        self.alerts += other.alerts
+        self.flagged_lost += other.flagged_lost
+        self.missed_lost += other.missed_lost
+        self.flagged_claimed += other.flagged_claimed
+        self.clean_claimed += other.clean_claimed
+        self.open_bags += other.open_bags
+        self.idle_bags += other.idle_bags
+        self.resumed_bags += other.resumed_bags
+        self.unobserved_lost += other.unobserved_lost
+        self.unobserved_claimed += other.unobserved_claimed
+
+    def to_dict(self) -> Dict:
+        thresholds = asdict(self.thresholds)
+        thresholds["expected_times"] = {
+            f"{a.value}->{b.value}": minutes
+            for (a, b), minutes in self.thresholds.expected_times.items()
+        }
+        return {
+            "thresholds": thresholds,
+            "alerts": self.alerts,
+            "flagged_lost": self.flagged_lost,
+            "missed_lost": self.missed_lost,
+            "flagged_claimed": self.flagged_claimed,
+            "clean_claimed": self.clean_claimed,
+            "open_bags": self.open_bags,
+            "idle_bags": self.idle_bags,
+            "resumed_bags": self.resumed_bags,
+            "unobserved_lost": self.unobserved_lost,
+            "unobserved_claimed": self.unobserved_claimed,
+            "false_positive_rate": self.false_positive_rate,
+            "false_negative_rate": self.false_negative_rate,
+        }
+
+
+def shard_bounds(shard: int, shards: int) -> Tuple[Optional[str], Optional[str]]:
+    """
+    bag_id range [low, high) for one shard.
+    Bag ids are uuid4 strings, so splitting on the first four hex digits gives
+    even shards. Together the ranges cover every string, so any id lands in
+    exactly one shard. Ranges stay index-friendly and portable across dialects.
+    """
+    low = None if shard == 0 else f"{shard * 0x10000 // shards:04x}"
+    high = None if shard == shards - 1 else f"{(shard + 1) * 0x10000 // shards:04x}"
+    return low, high
+
+
+async def stream_checkpoints(
+    engine: AsyncEngine,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    shard: int = 0,
+    shards: int = 1
+) -> AsyncIterator[Tuple[str, CheckpointStage, datetime]]:
+    """
+    Yield (bag_id, checkpoint, scanned_at) in scanned_at order for one bag shard.
+    Uses a server-side cursor so only chunk_size rows are buffered at a time.
+    """
+    q = select(CheckpointLog.bag_id, CheckpointLog.checkpoint, CheckpointLog.scanned_at)
+    if since:
+        q = q.where(CheckpointLog.scanned_at >= since)
+    if until:
+        q = q.where(CheckpointLog.scanned_at < until)
+    low, high = shard_bounds(shard, shards)
+    if low:
+        q = q.where(CheckpointLog.bag_id >= low)
+    if high:
+        q = q.where(CheckpointLog.bag_id < high)
+    q = q.order_by(CheckpointLog.scanned_at, CheckpointLog.id)
+
+    async with engine.connect() as conn:
+        result = await conn.stream(q.execution_options(yield_per=chunk_size))
+        async for partition in result.partitions(chunk_size):
+            for bag_id, checkpoint, scanned_at in partition:
+                yield bag_id, CheckpointStage(checkpoint), scanned_at
+
+
+async def replay(
+    engine: AsyncEngine,
+    param_sets: List[DelayThresholds],
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    flag_level: RiskLevel = RiskLevel.HIGH,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    shard: int = 0,
+    shards: int = 1,
+    idle_horizon: timedelta = DEFAULT_IDLE_HORIZON
+) -> List[ReplayReport]:
+    """
+    Replay one bag shard of the checkpoint history and score every parameter set.
+
+    Args:
+        engine: Async engine to stream from
+        param_sets: Candidate thresholds to evaluate
+        since, until: Optional scanned_at window
+        flag_level: Minimum risk level that counts as flagging a bag
+        chunk_size: Rows fetched per cursor round trip
+        shard, shards: Which bag_id range to replay (see shard_bounds)
+        idle_horizon: Gaps are evaluated up to this; bags idle longer go dormant
+
+    Returns:
+        One ReplayReport per parameter set, in input order
+    """
+    reports = [ReplayReport(thresholds=t) for t in param_sets]
+    min_rank = RISK_ORDER[flag_level]
+    horizon_minutes = idle_horizon.total_seconds() / 60.0
+    # bag_id -> (last checkpoint, last scanned_at, per-parameter-set flags)
+    open_bags: Dict[str, Tuple[CheckpointStage, datetime, bytearray]] = {}
+    # bag_id -> flags of bags idle past the horizon
+    dormant: Dict[str, bytes] = {}
+    resumed = 0
+    unobserved = {CheckpointStage.LOST: 0, CheckpointStage.CLAIMED: 0}
+    rows = 0
+
+    def score_gap(last_checkpoint: CheckpointStage, minutes: float, flags: bytearray):
+        expected_next = get_next_stage(last_checkpoint)
+        for i, thresholds in enumerate(param_sets):
+            risk = assess_delay_minutes(last_checkpoint, expected_next, minutes, thresholds)
+            if RISK_ORDER[risk] >= min_rank:
+                reports[i].alerts += 1
+                flags[i] = 1
+
+    async for bag_id, checkpoint, scanned_at in stream_checkpoints(
+        engine, since, until, chunk_size, shard, shards
+    ):
+        rows += 1
+        if rows % chunk_size == 0:
+            cutoff = scanned_at - idle_horizon
+            idle = [k for k, (_, last, _) in open_bags.items() if last < cutoff]
+            for key in idle:
+                last_checkpoint, _, flags = open_bags.pop(key)
+                score_gap(last_checkpoint, horizon_minutes, flags)
+                dormant[key] = bytes(flags)
+
+        state = open_bags.get(bag_id)
+        if state is not None:
+            last_checkpoint, last_scanned_at, flags = state
+            minutes = (scanned_at - last_scanned_at).total_seconds() / 60.0
+            if minutes > horizon_minutes:
+                # Idle past the horizon but not swept yet: same as a dormant bag
+                resumed += 1
+                minutes = horizon_minutes
+            score_gap(last_checkpoint, minutes, flags)
+        elif bag_id in dormant:
+            # The idle gap was scored when the bag went dormant
+            resumed += 1
+            flags = bytearray(dormant.pop(bag_id))
+        elif is_terminal_stage(checkpoint):
+            # Journey started before the window
+            if checkpoint in unobserved:
+                unobserved[checkpoint] += 1
+            continue
+        else:
+            flags = bytearray(len(param_sets))
+
+        if not is_terminal_stage(checkpoint):
+            open_bags[bag_id] = (checkpoint, scanned_at, flags)
+            continue
+
+        open_bags.pop(bag_id, None)
+        if checkpoint == CheckpointStage.LOST:
+            for report, flagged in zip(reports, flags):
+                if flagged:
+                    report.flagged_lost += 1
+                else:
+                    report.missed_lost += 1
+        elif checkpoint == CheckpointStage.CLAIMED:
+            for report, flagged in zip(reports, flags):
+                if flagged:
+                    report.flagged_claimed += 1
+                else:
+                    report.clean_claimed += 1
+
+    for report in reports:
+        report.open_bags = len(open_bags) + len(dormant)
+        report.idle_bags = len(dormant)
+        report.resumed_bags = resumed
+        report.unobserved_lost = unobserved[CheckpointStage.LOST]
+        report.unobserved_claimed = unobserved[CheckpointStage.CLAIMED]
+    return reports
+
+
+def _replay_worker(
+    database_url: str,
+    param_sets: List[DelayThresholds],
+    since: Optional[datetime],
+    until: Optional[datetime],
+    flag_level: RiskLevel,
+    chunk_size: int,
+    shard: int,
+    shards: int,
+    idle_horizon: timedelta
+) -> List[ReplayReport]:
+    # Each process gets its own engine; pooled connections must not cross a fork
+    async def run() -> List[ReplayReport]:
+        engine = create_async_engine(database_url, future=True)
+        try:
+            return await replay(
+                engine, param_sets, since, until, flag_level, chunk_size, shard, shards, idle_horizon
+            )
+        finally:
+            await engine.dispose()
+
+    return asyncio.run(run())
+
+
+def evaluate_parameter_sets(
+    param_sets: List[DelayThresholds],
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    flag_level: RiskLevel = RiskLevel.HIGH,
+    workers: int = 4,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    database_url: str = DATABASE_URL,
+    idle_horizon: timedelta = DEFAULT_IDLE_HORIZON
+) -> List[ReplayReport]:
+    """
+    Score parameter sets in parallel across a process pool.
+    Each worker streams 1/workers of the bags and scores every set on them,
+    so the database read is split rather than repeated; reports are summed.
+    """
+    workers = max(1, workers)
+    reports = [ReplayReport(thresholds=t) for t in param_sets]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(
+                _replay_worker, database_url, param_sets, since, until,
+                flag_level, chunk_size, shard, workers, idle_horizon
+            )
+            for shard in range(workers)
+        ]
+        for future in futures:
+            for total, part in zip(reports, future.result()):
+                total.merge(part)
+    return reports
+
+
+def build_parameter_grid(
+    medium_multipliers: List[float],
+    high_multipliers: List[float],
+    time_scales: List[float],
+    base: DelayThresholds = DEFAULT_THRESHOLDS
+) -> List[DelayThresholds]:
+    """
+    Cartesian product of multipliers and a uniform scale on the expected times.
+    Combinations where the high multiplier does not exceed the medium one are skipped.
+    """
+    grid = []
+    for medium, high, scale in product(medium_multipliers, high_multipliers, time_scales):
+        if high <= medium:
+            continue
+        expected_times = {
+            key: (minutes * scale if minutes is not None else None)
+            for key, minutes in base.expected_times.items()
+        }
+        grid.append(replace(
+            base,
+            expected_times=expected_times,
+            medium_multiplier=medium,
+            high_multiplier=high,
+        ))
+    return grid
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay checkpoint history under candidate delay thresholds")
+    parser.add_argument("--medium", type=float, nargs="+", default=[DEFAULT_THRESHOLDS.medium_multiplier],
+                        help="Candidate medium-risk multipliers")
+    parser.add_argument("--high", type=float, nargs="+", default=[DEFAULT_THRESHOLDS.high_multiplier],
+                        help="Candidate high-risk multipliers")
+    parser.add_argument("--scale", type=float, nargs="+", default=[1.0],
+                        help="Candidate scale factors applied to EXPECTED_TIMES")
+    parser.add_argument("--flag-level", type=RiskLevel, default=RiskLevel.HIGH, choices=list(RiskLevel))
+    parser.add_argument("--since", type=datetime.fromisoformat, default=None)
+    parser.add_argument("--until", type=datetime.fromisoformat, default=None)
+    parser.add_argument("--workers", type=int, default=4, help="Processes; the log is split by bag across them")
+    parser.add_argument("--idle-horizon-hours", type=float, default=DEFAULT_IDLE_HORIZON.total_seconds() / 3600,
+                        help="Gaps are evaluated up to this; idle bags keep only their flags")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    grid = build_parameter_grid(args.medium, args.high, args.scale)
+    reports = evaluate_parameter_sets(
+        grid, args.since, args.until, args.flag_level, args.workers, args.chunk_size,
+        idle_horizon=timedelta(hours=args.idle_horizon_hours)
+    )
+    # One JSON object per parameter set
+    for report in reports:
+        print(json.dumps(report.to_dict()))
+
+
+if __name__ == "__main__":
+    main()
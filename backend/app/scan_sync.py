@@ -0,0 +1,143 @@
+"""
+Offline scanner sync utilities
+
+Handheld scanners that lose connectivity buffer their reads locally and
+upload them later as sequence-numbered batches. This module decodes the
+compact upload formats into SyncBatch objects:
+
+- NDJSON (application/x-ndjson), one batch per line, optionally gzip-compressed
+  (Content-Encoding: gzip)
+- MessagePack (application/msgpack), an array of batches
+"""
+import hashlib
+import json
+import zlib
+from datetime import datetime, timezone
+from typing import AsyncIterator, List, Optional
+
+import msgpack
+
+from .schemas import SyncBatch
+
+NDJSON_TYPES = {"application/x-ndjson", "application/ndjson", "application/jsonl"}
+MSGPACK_TYPES = {"application/msgpack", "application/x-msgpack"}
+
+# Upper bound on the decompressed body, guards against gzip bombs.
+# An hour of scans from a busy stand is well under 1 MiB of NDJSON.
+MAX_SYNC_PAYLOAD_BYTES = 16 * 1024 * 1024
+
+
+class SyncPayloadError(ValueError):
+    """Raised when a sync upload cannot be decoded"""
+
+
+class SyncConflictError(Exception):
+    """Raised when a known batch seq arrives with different content"""
+
+    def __init__(self, seqs: List[int]):
+        super().__init__(f"Batch seq already used with different content: {seqs}")
+        self.seqs = seqs
+
+
+def _media_type(content_type: Optional[str]) -> str:
+    return (content_type or "").split(";")[0].strip().lower()
+
+
+def _gunzip(body: bytes) -> bytes:
+    # wbits=31 selects the gzip container
+    inflater = zlib.decompressobj(wbits=31)
+    try:
+        data = inflater.decompress(body, MAX_SYNC_PAYLOAD_BYTES)
+    except zlib.error as e:
+        raise SyncPayloadError(f"Invalid gzip body: {e}")
+    if inflater.unconsumed_tail:
+        raise SyncPayloadError("Sync payload too large")
+    return data
+
+
+def _normalize_timestamps(batch: SyncBatch) -> SyncBatch:
+    # CheckpointLog.scanned_at is stored as naive UTC
+    for scan in batch.scans:
+        if scan.scanned_at.tzinfo is not None:
+            scan.scanned_at = scan.scanned_at.astimezone(timezone.utc).replace(tzinfo=None)
+    return batch
+
+
+async def read_sync_body(chunks: AsyncIterator[bytes], content_length: Optional[str] = None) -> bytes:
+    """
+    Read a request body, refusing anything over MAX_SYNC_PAYLOAD_BYTES
+    before it is buffered. The compressed size is capped as well, so an
+    oversized upload is never held in memory whatever its encoding.
+    """
+    if content_length and content_length.isdigit() and int(content_length) > MAX_SYNC_PAYLOAD_BYTES:
+        raise SyncPayloadError("Sync payload too large")
+    body = bytearray()
+    async for chunk in chunks:
+        body += chunk
+        if len(body) > MAX_SYNC_PAYLOAD_BYTES:
+            raise SyncPayloadError("Sync payload too large")
+    return bytes(body)
+
+
+def decode_sync_payload(
+    body: bytes,
+    content_type: Optional[str],
+    content_encoding: Optional[str] = None
+) -> List[SyncBatch]:
+    """
+    Decode an offline sync upload into batches
+
+    Args:
+        body: Raw request body
+        content_type: Request Content-Type header
+        content_encoding: Request Content-Encoding header ("gzip" or None)
+
+    Returns:
+        List of SyncBatch with timestamps normalized to naive UTC
+    """
+    if (content_encoding or "").strip().lower() == "gzip":
+        body = _gunzip(body)
+    elif len(body) > MAX_SYNC_PAYLOAD_BYTES:
+        raise SyncPayloadError("Sync payload too large")
+
+    media_type = _media_type(content_type)
+    try:
+        if media_type in MSGPACK_TYPES:
+            raw = msgpack.unpackb(body, raw=False)
+            if isinstance(raw, dict):
+                raw = [raw]
+        elif media_type in NDJSON_TYPES or media_type == "":
+            raw = [json.loads(line) for line in body.splitlines() if line.strip()]
+        else:
+            raise SyncPayloadError(f"Unsupported content type: {media_type}")
+        return [_normalize_timestamps(SyncBatch.parse_obj(item)) for item in raw]
+    except SyncPayloadError:
+        raise
+    except Exception as e:
+        raise SyncPayloadError(f"Malformed sync payload: {e}")
+
+
+def batch_digest(batch: SyncBatch) -> str:
+    """
+    Content hash of a batch, independent of scan order and encoding.
+    Call after decode_sync_payload so timestamps are already normalized.
+    """
+    scans = sorted(
+        json.dumps({
+            "bag_id": scan.bag_id,
+            "scanned_at": scan.scanned_at.isoformat(),
+            "checkpoint": scan.checkpoint.value if scan.checkpoint else None,
+            "location": scan.location,
+            "status_note": scan.status_note,
+        }, sort_keys=True)
+        for scan in batch.scans
+    )
+    return hashlib.sha256("\n".join(scans).encode("utf-8")).hexdigest()
+
+
+def clamp_capture_time(scanned_at: datetime, received_at: datetime) -> datetime:
+    """
+    Device clocks drift; a capture time in the future would make the bag
+    look freshly scanned forever, so cap it at the upload time.
+    """
+    return min(scanned_at, received_at)
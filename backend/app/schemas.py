@@ -1,5 +1,6 @@
 ﻿from sqlmodel import SQLModel
 from typing import Optional, List
+from pydantic import conint
 from datetime import datetime
 from .models import Bag, CheckpointLog, CheckpointStage, Scanner
 
@@ -50,3 +51,39 @@ class ScannerCreate(SQLModel):
 
 class ScannerRead(Scanner):
     pass
+
+class SyncScan(SQLModel):
+    """A single scan captured while the scanner was offline"""
+    bag_id: str
+    scanned_at: datetime  # original capture time on the device
+    checkpoint: Optional[CheckpointStage] = None  # defaults to the scanner's checkpoint
+    location: Optional[str] = None
+    status_note: Optional[str] = None
+
+class SyncBatch(SQLModel):
+    seq: conint(ge=1)  # high_water_mark counts from 1
+    scans: List[SyncScan] = []
+
+class SyncResult(SQLModel):
+    scanner_id: str
+    high_water_mark: Optional[int] = None  # every batch seq 1..high_water_mark has been applied
+    last_seq: Optional[int] = None  # highest batch seq recorded; new batches must start above it
+    applied_batches: List[int] = []
+    duplicate_batches: List[int] = []
+    applied_scans: int = 0
+    rejected_scans: int = 0  # stored as RejectedScan rows, not dropped
+    errors: List[str] = []
+
+class SearchHit(SQLModel):
+    bag: BagRead
+    score: float
+    # Derived from the latest checkpoint only, so no full history is loaded per hit
+    current_stage: Optional[CheckpointStage] = None
+    operational_status: str
+    status_label: str
+    risk_level: str
+    last_scanned_at: Optional[datetime] = None
+
+class SearchResults(SQLModel):
+    hits: List[SearchHit] = []
+    next_cursor: Optional[str] = None  # pass back as `cursor` for the next page
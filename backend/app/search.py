@@ -0,0 +1,162 @@
+"""
+Indexed passenger and tag search
+
+Service desk agents look bags up by partial passenger name or tag number.
+Substring matches are served from an index instead of a LIKE '%x%' scan:
+
+- PostgreSQL: pg_trgm GIN indexes on bag.tag_number and bag.passenger_name.
+  Hits match by substring (ILIKE) or trigram word similarity, so small typos
+  still match. They are ranked by word similarity, which scores a short query
+  against the best-matching part of a long tag, with exact substring matches
+  boosted above fuzzy ones.
+- SQLite: an FTS5 table using the trigram tokenizer, kept in sync by
+  triggers. Hits are ranked the same way, by which field contains the query
+  and how much of that field it covers. bm25 is not used: it depends on
+  statistics across the whole table, so every new bag would shift the scores
+  and a cursor taken before it would skip or repeat rows.
+
+The indexes are created by app/migrate_add_search_indexes.py, not at startup;
+until it has run, search raises SearchUnavailableError.
+
+Results are paginated by keyset on (score, id). The cursor is opaque to clients.
+"""
+import base64
+import json
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError, ProgrammingError
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from .database import engine
+
+# Trigram indexes cannot serve shorter patterns
+MIN_QUERY_LENGTH = 3
+
+POSTGRES_SEARCH = """
+    SELECT * FROM (
+        SELECT b.*,
+               CAST(GREATEST(
+                   word_similarity(:q, b.tag_number),
+                   word_similarity(:q, COALESCE(b.passenger_name, ''))
+               ) + CASE
+                   WHEN b.tag_number ILIKE :pattern THEN 1.0
+                   WHEN b.passenger_name ILIKE :pattern THEN 0.5
+                   ELSE 0.0
+               END AS double precision) AS score
+        FROM bag b
+        WHERE b.tag_number ILIKE :pattern
+           OR b.passenger_name ILIKE :pattern
+           OR :q <% b.tag_number
+           OR :q <% b.passenger_name
+    ) hits
+"""
+
+SQLITE_SEARCH = """
+    SELECT * FROM (
+        SELECT b.*,
+               CASE
+                   WHEN instr(lower(b.tag_number), lower(:q)) > 0
+                       THEN 1.0 + CAST(length(:q) AS REAL) / length(b.tag_number)
+                   WHEN instr(lower(b.passenger_name), lower(:q)) > 0
+                       THEN 0.5 + CAST(length(:q) AS REAL) / length(b.passenger_name)
+                   ELSE 0.0
+               END AS score
+        FROM bag_search JOIN bag b ON b.id = bag_search.bag_id
+        WHERE bag_search MATCH :match
+    ) hits
+"""
+
+
+class SearchUnavailableError(RuntimeError):
+    """Raised when the search indexes or pg_trgm have not been set up"""
+
+
+def _missing_search_objects(error: Exception) -> bool:
+    # SQLite: "no such table: bag_search"; PostgreSQL without pg_trgm:
+    # "function word_similarity(...) does not exist" / "operator does not exist"
+    message = str(getattr(error, "orig", error))
+    return "no such table" in message or "does not exist" in message
+
+
+def encode_cursor(score: float, bag_id: str) -> str:
+    raw = json.dumps([score, bag_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Tuple[float, str]:
+    """Raises ValueError for a cursor this module did not produce"""
+    try:
+        score, bag_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return float(score), str(bag_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def _like_pattern(q: str) -> str:
+    escaped = q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def _fts_phrase(q: str) -> str:
+    # A quoted phrase of trigrams matches the query as a substring
+    return '"' + q.replace('"', '""') + '"'
+
+
+async def _search(conn: AsyncConnection, q: str, limit: int, after: Optional[Tuple[float, str]]) -> List[Dict]:
+    if conn.dialect.name == "postgresql":
+        sql = POSTGRES_SEARCH
+        params = {"q": q, "pattern": _like_pattern(q)}
+    elif conn.dialect.name == "sqlite":
+        sql = SQLITE_SEARCH
+        params = {"q": q, "match": _fts_phrase(q)}
+    else:
+        raise NotImplementedError(f"Search is not supported on {conn.dialect.name}")
+
+    if after:
+        sql += " WHERE hits.score < :after_score OR (hits.score = :after_score AND hits.id > :after_id)"
+        params["after_score"], params["after_id"] = after
+    sql += " ORDER BY hits.score DESC, hits.id LIMIT :limit"
+    params["limit"] = limit
+
+    try:
+        result = await conn.execute(text(sql), params)
+    except (OperationalError, ProgrammingError) as e:
+        if _missing_search_objects(e):
+            raise SearchUnavailableError(
+                "Search indexes are missing; run python -m app.migrate_add_search_indexes"
+            ) from e
+        raise
+    return [dict(row) for row in result.mappings()]
+
+
+async def search_bags(q: str, limit: int = 20, cursor: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+    """
+    Ranked bag search with keyset pagination.
+
+    Args:
+        q: Partial passenger name or tag number (at least MIN_QUERY_LENGTH characters)
+        limit: Page size
+        cursor: next_cursor from the previous page
+
+    Returns:
+        (bag rows with a `score` key, cursor for the next page or None)
+
+    Raises:
+        ValueError: query too short or cursor invalid
+        NotImplementedError: database dialect has no search support
+        SearchUnavailableError: the search migration has not been run
+    """
+    q = q.strip()
+    if len(q) < MIN_QUERY_LENGTH:
+        raise ValueError(f"Query must be at least {MIN_QUERY_LENGTH} characters")
+    after = decode_cursor(cursor) if cursor else None
+    async with engine.connect() as conn:
+        # One extra row tells us whether another page exists
+        rows = await _search(conn, q, limit + 1, after)
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]["score"], rows[-1]["id"])
+    return rows, next_cursor
@@ -11,10 +11,11 @@ Key Concepts:
 - Risk: Assessment of whether bag is on track or delayed
 """
 
-from typing import List, Optional, Dict
+from typing import List, Optional, Dict, Tuple
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta
 from enum import Enum
-from .models import CheckpointLog, CheckpointStage
+from .models import CheckpointLog, CheckpointStage, get_next_stage
 
 class OperationalStatus(str, Enum):
     """High-level operational status labels"""
@@ -45,6 +46,22 @@ EXPECTED_TIMES = {
     (CheckpointStage.ARRIVAL, CheckpointStage.CLAIMED): 30,  # Typical claim time
 }
 
+@dataclass(frozen=True)
+class DelayThresholds:
+    """
+    Tunable parameters for delay assessment.
+    Defaults reproduce the production rules; the replay engine
+    (replay.py) evaluates alternative sets against historical outcomes.
+    """
+    expected_times: Dict[Tuple[CheckpointStage, CheckpointStage], Optional[float]] = field(
+        default_factory=lambda: dict(EXPECTED_TIMES)
+    )
+    medium_multiplier: float = 2.0
+    high_multiplier: float = 3.0
+    variable_medium_minutes: float = 180  # used when the expected time is variable
+
+DEFAULT_THRESHOLDS = DelayThresholds()
+
 # Terminal stages - no further progression expected
 TERMINAL_STAGES = {
     CheckpointStage.CLAIMED,
@@ -52,12 +69,16 @@ TERMINAL_STAGES = {
     CheckpointStage.RETURNED_TO_AGENT
 }
 
-def get_expected_time(current: CheckpointStage, next: CheckpointStage) -> Optional[int]:
+def get_expected_time(
+    current: CheckpointStage,
+    next: CheckpointStage,
+    thresholds: DelayThresholds = DEFAULT_THRESHOLDS
+) -> Optional[float]:
     """
     Get expected time (in minutes) between two checkpoints.
     Returns None if time is highly variable (e.g., flight duration).
     """
-    return EXPECTED_TIMES.get((current, next))
+    return thresholds.expected_times.get((current, next))
 
 def is_terminal_stage(stage: CheckpointStage) -> bool:
     """Check if a stage is terminal (no further progression)"""
@@ -68,55 +89,73 @@ def get_stage_index(stage: CheckpointStage) -> int:
     stages = list(CheckpointStage)
     return stages.index(stage)
 
-def calculate_time_since_last_scan(history: List[CheckpointLog]) -> Optional[float]:
+def calculate_time_since_last_scan(
+    history: List[CheckpointLog],
+    now: Optional[datetime] = None
+) -> Optional[float]:
     """
     Calculate minutes since last scan.
     Returns None if no history exists.
+    `now` defaults to the current time; the replay engine passes a simulated time.
     """
     if not history:
         return None
     last_scan = history[-1].scanned_at
-    now = datetime.utcnow()
+    now = now or datetime.utcnow()
     delta = now - last_scan
     return delta.total_seconds() / 60.0
 
-def assess_delay(history: List[CheckpointLog], expected_next: Optional[CheckpointStage]) -> RiskLevel:
+def assess_delay_minutes(
+    last_checkpoint: CheckpointStage,
+    expected_next: Optional[CheckpointStage],
+    time_since: Optional[float],
+    thresholds: DelayThresholds = DEFAULT_THRESHOLDS
+) -> RiskLevel:
     """
-    Assess if bag is delayed based on time since last scan and expected progression.
-    
-    Logic:
-    - If no expected next stage, risk is LOW (terminal or just started)
-    - If time exceeds expected threshold, risk increases
-    - Missing expected scans increases risk
+    Core delay rule on plain values, shared by assess_delay and the replay engine.
     """
-    if not history:
-        return RiskLevel.LOW
-    
-    if not expected_next:
+    if not expected_next or time_since is None:
         return RiskLevel.LOW
     
-    last_scan = history[-1]
-    time_since = calculate_time_since_last_scan(history)
-    
-    if time_since is None:
-        return RiskLevel.LOW
-    
-    expected_time = get_expected_time(last_scan.checkpoint, expected_next)
+    expected_time = get_expected_time(last_checkpoint, expected_next, thresholds)
     
     if expected_time is None:
         # Variable time (e.g., flight duration) - use longer threshold
-        if time_since > 180:  # 3 hours
+        if time_since > thresholds.variable_medium_minutes:  # 3 hours by default
             return RiskLevel.MEDIUM
         return RiskLevel.LOW
     
     # Compare actual time vs expected
-    if time_since > expected_time * 3:  # 3x expected time = high risk
+    if time_since > expected_time * thresholds.high_multiplier:  # 3x expected time = high risk
         return RiskLevel.HIGH
-    elif time_since > expected_time * 2:  # 2x expected time = medium risk
+    elif time_since > expected_time * thresholds.medium_multiplier:  # 2x expected time = medium risk
         return RiskLevel.MEDIUM
     else:
         return RiskLevel.LOW
 
+def assess_delay(
+    history: List[CheckpointLog],
+    expected_next: Optional[CheckpointStage],
+    now: Optional[datetime] = None,
+    thresholds: DelayThresholds = DEFAULT_THRESHOLDS
+) -> RiskLevel:
+    """
+    Assess if bag is delayed based on time since last scan and expected progression.
+    
+    Logic:
+    - If no expected next stage, risk is LOW (terminal or just started)
+    - If time exceeds expected threshold, risk increases
+    - Missing expected scans increases risk
+    """
+    if not history:
+        return RiskLevel.LOW
+    
+    if not expected_next:
+        return RiskLevel.LOW
+    
+    time_since = calculate_time_since_last_scan(history, now)
+    return assess_delay_minutes(history[-1].checkpoint, expected_next, time_since, thresholds)
+
 def get_completed_stages(history: List[CheckpointLog]) -> List[CheckpointStage]:
     """
     Extract all unique checkpoint stages that have been completed.
@@ -251,3 +290,21 @@ def derive_operational_state(
         "is_delayed": is_delayed,
         "is_terminal": current_stage in TERMINAL_STAGES if current_stage else False,
     }
+
+def derive_stage_summary(latest: Optional[CheckpointLog]) -> Dict:
+    """
+    Lightweight variant of derive_operational_state for list views.
+    Current stage, status and risk depend only on the latest checkpoint,
+    so callers can fetch that one row per bag instead of the full history.
+    """
+    history = [latest] if latest else []
+    current_stage = determine_current_stage(history)
+    expected_next = get_next_stage(current_stage) if current_stage else None
+    operational_status = determine_operational_status(current_stage, history, expected_next)
+    return {
+        "current_stage": current_stage,
+        "operational_status": operational_status,
+        "status_label": get_status_label(operational_status, current_stage),
+        "risk_level": assess_delay(history, expected_next),
+        "last_scanned_at": latest.scanned_at if latest else None,
+    }
@@ -0,0 +1,39 @@
+import asyncio
+import os
+import tempfile
+
+import pytest
+
+# Must be set before app.database creates the engine
+TEST_DB_PATH = os.path.join(tempfile.gettempdir(), "baggage_tracker_test.db")
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{TEST_DB_PATH}"
+
+from sqlmodel import SQLModel
+
+from app.database import engine
+
+
+@pytest.fixture
+def run():
+    """Run a coroutine on a fresh event loop, then release pooled connections bound to it"""
+    def _run(coro):
+        async def wrapper():
+            try:
+                return await coro
+            finally:
+                await engine.dispose()
+        return asyncio.run(wrapper())
+    return _run
+
+
+@pytest.fixture
+def db(run):
+    """Empty schema for each test"""
+    async def reset():
+        async with engine.begin() as conn:
+            await conn.run_sync(SQLModel.metadata.drop_all)
+            await conn.run_sync(SQLModel.metadata.create_all)
+    run(reset())
+    yield
+    if os.path.exists(TEST_DB_PATH):
+        os.remove(TEST_DB_PATH)
@@ -0,0 +1,153 @@
+import httpx
+import pytest
+from fastapi import HTTPException
+from sqlalchemy.pool import NullPool, QueuePool
+from starlette.requests import Request
+
+from app import admission
+from app.admission import AdmissionController, Priority, RateLimiter, check_rate_limits, pool_capacity
+
+
+def make_request(path_params=None, query=b"", headers=None, client=("10.0.0.1", 1234)) -> Request:
+    return Request({
+        "type": "http",
+        "method": "POST",
+        "path": "/scan/auto",
+        "query_string": query,
+        "headers": [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()],
+        "path_params": path_params or {},
+        "client": client,
+    })
+
+
+def test_bucket_refills_at_rate():
+    limiter = RateLimiter(rate=2, burst=2)
+    assert limiter.try_acquire("s1", now=0.0) == 0.0
+    assert limiter.try_acquire("s1", now=0.0) == 0.0
+    # Empty: next token in 1/rate seconds
+    assert limiter.try_acquire("s1", now=0.0) == pytest.approx(0.5)
+    assert limiter.try_acquire("s1", now=0.25) == pytest.approx(0.25)
+    assert limiter.try_acquire("s1", now=0.5) == 0.0
+    # Refill is capped at burst
+    assert limiter.try_acquire("s1", now=100.0) == 0.0
+    assert limiter.try_acquire("s1", now=100.0) == 0.0
+    assert limiter.try_acquire("s1", now=100.0) > 0
+    # Other keys are unaffected
+    assert limiter.try_acquire("s2", now=0.0) == 0.0
+
+
+def test_eviction_bounds_key_table():
+    limiter = RateLimiter(rate=1, burst=1, max_keys=10)
+    for i in range(10):
+        limiter.try_acquire(f"k{i}", now=0.0)
+    # All buckets refilled by now, so they are dropped to make room
+    limiter.try_acquire("new", now=5.0)
+    assert set(limiter._buckets) == {"new"}
+
+    for i in range(20):
+        limiter.try_acquire(f"busy{i}", now=6.0 + i * 0.01)
+        assert len(limiter._buckets) <= 10
+    # Least recently seen active keys go first
+    assert "busy19" in limiter._buckets and "busy0" not in limiter._buckets
+
+
+def test_scanner_limit_sets_retry_after(monkeypatch):
+    monkeypatch.setattr(admission, "scanner_limiter", RateLimiter(rate=0.25, burst=1))
+    request = make_request(query=b"scanner_id=S1")
+    check_rate_limits(request)
+    with pytest.raises(HTTPException) as e:
+        check_rate_limits(request)
+    assert e.value.status_code == 429
+    assert e.value.headers["Retry-After"] == "4"
+
+
+def test_rotating_scanner_id_is_still_limited_per_client(monkeypatch):
+    monkeypatch.setattr(admission, "scanner_limiter", RateLimiter(rate=1, burst=1))
+    monkeypatch.setattr(admission, "client_limiter", RateLimiter(rate=1, burst=5))
+    # A fresh scanner_id on every request gets a full scanner bucket each time
+    for i in range(5):
+        check_rate_limits(make_request(path_params={"scanner_id": f"S{i}"}))
+    with pytest.raises(HTTPException) as e:
+        check_rate_limits(make_request(path_params={"scanner_id": "S5"}))
+    assert "client" in e.value.detail
+    # Scanners behind another address are unaffected
+    check_rate_limits(make_request(path_params={"scanner_id": "S6"}, client=("10.0.0.2", 1234)))
+
+
+def test_client_bucket_uses_trusted_header(monkeypatch):
+    monkeypatch.setattr(admission, "client_limiter", RateLimiter(rate=1, burst=1))
+    monkeypatch.setattr(admission, "CLIENT_IP_HEADER", "X-Forwarded-For")
+    check_rate_limits(make_request(headers={"X-Forwarded-For": "203.0.113.1, 10.0.0.1"}))
+    check_rate_limits(make_request(headers={"X-Forwarded-For": "203.0.113.2, 10.0.0.1"}))
+    with pytest.raises(HTTPException):
+        check_rate_limits(make_request(headers={"X-Forwarded-For": "203.0.113.1"}))
+
+
+def test_reads_are_shed_before_writes():
+    controller = AdmissionController(max_concurrency=5, read_share=0.6)
+    assert [controller.try_admit(Priority.READ) for _ in range(4)] == [True, True, True, False]
+    # Writes may still use the rest of the limit
+    assert controller.try_admit(Priority.WRITE)
+    assert controller.try_admit(Priority.WRITE)
+    assert not controller.try_admit(Priority.WRITE)
+
+    controller.release()
+    assert not controller.try_admit(Priority.READ)
+    with controller.slot(Priority.WRITE):
+        with pytest.raises(HTTPException) as e:
+            with controller.slot(Priority.WRITE):
+                pass
+    assert e.value.status_code == 429 and e.value.headers["Retry-After"] == "1"
+    assert controller.in_flight == 4
+
+
+def test_pool_capacity():
+    assert pool_capacity(QueuePool(lambda: None, pool_size=5, max_overflow=10)) == 15
+    assert pool_capacity(QueuePool(lambda: None, pool_size=5, max_overflow=-1)) == admission.DEFAULT_MAX_CONCURRENCY
+    assert pool_capacity(NullPool(lambda: None)) == admission.DEFAULT_MAX_CONCURRENCY
+
+
+def test_saturated_server_sheds_reads_with_429(db, run, monkeypatch):
+    from app.main import app
+
+    controller = AdmissionController(max_concurrency=2, read_share=0.5)
+    monkeypatch.setattr(admission, "admission", controller)
+    controller.in_flight = 1
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            read = await client.get("/scanners")
+            write = await client.post("/scanners", json={"name": "Gate 1", "location": "T1", "checkpoint": "CHECKIN"})
+            return read, write
+
+    read, write = run(scenario())
+    assert read.status_code == 429 and read.headers["retry-after"] == "1"
+    assert write.status_code == 200
+    assert controller.in_flight == 1
+
+
+def test_exports_do_not_take_read_slots(db, run, monkeypatch):
+    from app.main import app
+
+    controller = AdmissionController(max_concurrency=2, read_share=0.5)
+    exports = AdmissionController(max_concurrency=1, read_share=1.0)
+    monkeypatch.setattr(admission, "admission", controller)
+    monkeypatch.setattr(admission, "export_admission", exports)
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            # One export streaming: another export is shed, status reads are not
+            exports.in_flight = 1
+            second_export = await client.get("/export/bags")
+            read = await client.get("/scanners")
+            exports.in_flight = 0
+            export = await client.get("/export/bags")
+            return second_export, read, export
+
+    second_export, read, export = run(scenario())
+    assert second_export.status_code == 429
+    assert read.status_code == 200
+    assert export.status_code == 200
+    assert (controller.in_flight, exports.in_flight) == (0, 0)
@@ -0,0 +1,72 @@
+import csv
+import io
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.database import AsyncSessionLocal
+from app.export import export_columns, stream_export
+from app.models import Bag, CheckpointLog, CheckpointStage
+
+T0 = datetime(2024, 1, 1, 12, 0)
+
+
+async def collect(stream) -> bytes:
+    return b"".join([part async for part in stream])
+
+
+async def seed():
+    async with AsyncSessionLocal() as session:
+        for i, flight in enumerate(["BA1", "BA1", "LH2"]):
+            bag = Bag(id=f"bag-{i}", tag_number=f"T{i}", flight_number=flight, registered_at=T0 + timedelta(hours=i))
+            session.add(bag)
+            session.add(CheckpointLog(bag_id=bag.id, checkpoint=CheckpointStage.CHECKIN, scanned_at=T0 + timedelta(hours=i)))
+            session.add(CheckpointLog(bag_id=bag.id, checkpoint=CheckpointStage.LOADING, scanned_at=T0 + timedelta(hours=i, minutes=30)))
+        await session.commit()
+
+
+def test_csv_without_rows_is_header_only(db, run):
+    body = run(collect(stream_export("checkpoints", "csv")))
+    assert body.decode("utf-8").splitlines() == [",".join(export_columns("checkpoints"))]
+
+
+def test_checkpoint_filters(db, run):
+    async def scenario():
+        await seed()
+        return await collect(stream_export(
+            "checkpoints", "csv", flight_number="BA1", checkpoint=CheckpointStage.LOADING, chunk_size=1
+        ))
+
+    rows = list(csv.DictReader(io.StringIO(run(scenario()).decode("utf-8"))))
+    assert [(r["bag_id"], r["checkpoint"]) for r in rows] == [("bag-0", "LOADING"), ("bag-1", "LOADING")]
+
+
+def test_time_range_accepts_aware_timestamps(db, run):
+    async def scenario():
+        await seed()
+        # 13:00+01:00 is 12:00 UTC; until is exclusive
+        since = datetime.fromisoformat("2024-01-01T13:00:00+01:00")
+        until = datetime.fromisoformat("2024-01-01T14:00:00")
+        return await collect(stream_export("bags", "ndjson", since=since, until=until))
+
+    rows = [json.loads(line) for line in run(scenario()).decode("utf-8").splitlines()]
+    assert [r["id"] for r in rows] == ["bag-0", "bag-1"]
+    assert rows[0]["registered_at"] == "2024-01-01T12:00:00"
+
+
+def test_checkpoint_filter_rejected_for_bags():
+    with pytest.raises(ValueError):
+        stream_export("bags", "csv", checkpoint=CheckpointStage.LOADING)
+
+
+def test_parquet_keeps_typed_timestamps(db, run):
+    pq = pytest.importorskip("pyarrow.parquet")
+
+    async def scenario():
+        await seed()
+        return await collect(stream_export("checkpoints", "parquet", chunk_size=2))
+
+    table = pq.read_table(io.BytesIO(run(scenario())))
+    assert table.num_rows == 6
+    assert str(table.schema.field("scanned_at").type) == "timestamp[us]"
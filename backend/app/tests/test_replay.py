@@ -0,0 +1,127 @@
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+from app.database import DATABASE_URL, AsyncSessionLocal, engine
+from app.models import Bag, CheckpointLog, CheckpointStage as S
+from app.replay import ReplayReport, build_parameter_grid, evaluate_parameter_sets, replay, shard_bounds
+from app.state_derivation import DEFAULT_THRESHOLDS, RiskLevel
+
+T0 = datetime(2024, 1, 1)
+
+
+async def add_journey(session, gaps, outcome):
+    """CHECKIN -> SECURITY_CHECK -> TRANSFER, `gaps` minutes apart, then `outcome` (if any)"""
+    bag = Bag(id=str(uuid4()), tag_number="T")
+    session.add(bag)
+    t = T0
+    stages = [S.CHECKIN, S.SECURITY_CHECK, S.TRANSFER] + ([outcome] if outcome else [])
+    for stage, gap in zip(stages, [0] + gaps):
+        t += timedelta(minutes=gap)
+        session.add(CheckpointLog(bag_id=bag.id, checkpoint=stage, scanned_at=t))
+
+
+async def seed():
+    async with AsyncSessionLocal() as session:
+        # CHECKIN->SECURITY_CHECK expects 5 min (HIGH above 15), SECURITY_CHECK->TRANSFER 10 min (HIGH above 30)
+        await add_journey(session, [20, 5, 5], S.LOST)      # flagged LOST: true positive
+        await add_journey(session, [5, 5, 5], S.LOST)       # missed LOST: false negative
+        await add_journey(session, [5, 40, 5], S.CLAIMED)   # flagged CLAIMED: false positive
+        await add_journey(session, [5, 5, 5], S.CLAIMED)    # clean CLAIMED: true negative
+        await add_journey(session, [5, 5], None)            # still open
+        await session.commit()
+
+
+def test_replay_scores_known_outcomes(db, run):
+    async def scenario():
+        await seed()
+        return await replay(engine, [DEFAULT_THRESHOLDS])
+
+    [report] = run(scenario())
+    assert (report.flagged_lost, report.missed_lost) == (1, 1)
+    assert (report.flagged_claimed, report.clean_claimed) == (1, 1)
+    assert report.open_bags == 1
+    assert report.alerts == 2
+    assert report.false_positive_rate == 0.5
+    assert report.false_negative_rate == 0.5
+
+
+def test_replay_scores_each_parameter_set(db, run):
+    # With a 5x high multiplier the limits become 25 and 50 minutes, so neither the
+    # 20 minute nor the 40 minute gap is flagged
+    grid = build_parameter_grid([2.0], [3.0, 5.0], [1.0])
+
+    async def scenario():
+        await seed()
+        return await replay(engine, grid, flag_level=RiskLevel.HIGH)
+
+    strict, loose = run(scenario())
+    assert (strict.flagged_claimed, loose.flagged_claimed) == (1, 0)
+    assert (strict.flagged_lost, loose.flagged_lost) == (1, 0)
+
+
+def test_sharded_replay_sums_to_single_pass(db, run):
+    async def scenario():
+        await seed()
+        whole = await replay(engine, [DEFAULT_THRESHOLDS])
+        parts = [await replay(engine, [DEFAULT_THRESHOLDS], shard=w, shards=3) for w in range(3)]
+        return whole, parts
+
+    [whole], parts = run(scenario())
+    total = ReplayReport(thresholds=DEFAULT_THRESHOLDS)
+    for [part] in parts:
+        total.merge(part)
+    assert total.to_dict() == whole.to_dict()
+
+
+def test_process_pool_matches_single_pass(db, run):
+    grid = build_parameter_grid([2.0], [3.0, 5.0], [1.0])
+
+    async def scenario():
+        await seed()
+        return await replay(engine, grid)
+
+    expected = run(scenario())
+    pooled = evaluate_parameter_sets(grid, workers=2, database_url=DATABASE_URL)
+    assert [r.to_dict() for r in pooled] == [r.to_dict() for r in expected]
+
+
+def test_long_gaps_are_scored_when_bags_go_idle(db, run):
+    day = 60 * 24
+
+    async def scenario():
+        async with AsyncSessionLocal() as session:
+            # Lost after a 5 day gap: flagged when it went idle
+            await add_journey(session, [5, 5, 5 * day], S.LOST)
+            # 5 day gap, then a non-terminal scan, then the outcome
+            bag = Bag(id=str(uuid4()), tag_number="T")
+            session.add(bag)
+            for stage, minutes in [(S.CHECKIN, 0), (S.SECURITY_CHECK, 5 * day), (S.CLAIMED, 5 * day + 10)]:
+                session.add(CheckpointLog(bag_id=bag.id, checkpoint=stage, scanned_at=T0 + timedelta(minutes=minutes)))
+            # Never heard from again
+            await add_journey(session, [5], None)
+            await add_journey(session, [5, 5, 5], S.CLAIMED)
+            # Outcome with no earlier scan in the window
+            orphan = Bag(id=str(uuid4()), tag_number="T")
+            session.add(orphan)
+            session.add(CheckpointLog(bag_id=orphan.id, checkpoint=S.LOST, scanned_at=T0))
+            await session.commit()
+        swept = await replay(engine, [DEFAULT_THRESHOLDS], chunk_size=1, idle_horizon=timedelta(hours=72))
+        unswept = await replay(engine, [DEFAULT_THRESHOLDS], chunk_size=1000, idle_horizon=timedelta(hours=72))
+        return swept, unswept
+
+    [swept], [unswept] = run(scenario())
+    assert (swept.flagged_lost, swept.missed_lost) == (1, 0)
+    assert (swept.flagged_claimed, swept.clean_claimed) == (1, 1)
+    assert swept.resumed_bags == 2
+    assert (swept.open_bags, swept.idle_bags) == (1, 1)
+    assert swept.unobserved_lost == 1
+    # Gaps are capped at the horizon, so sweep timing does not change the outcome
+    assert (unswept.flagged_lost, unswept.flagged_claimed, unswept.resumed_bags) == (1, 1, 2)
+    assert unswept.idle_bags == 0 and unswept.open_bags == 1
+
+
+def test_shard_bounds_cover_id_space():
+    bounds = [shard_bounds(w, 3) for w in range(3)]
+    assert bounds[0][0] is None and bounds[-1][1] is None
+    for (_, high), (low, _) in zip(bounds, bounds[1:]):
+        assert high == low
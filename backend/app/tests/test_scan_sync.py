@@ -0,0 +1,168 @@
+import gzip
+import json
+from datetime import datetime
+
+import httpx
+import msgpack
+import pytest
+from sqlmodel import select
+
+from app import crud, scan_sync
+from app.main import app
+from app.models import CheckpointStage, RejectedScan
+from app.scan_sync import SyncConflictError, SyncPayloadError, batch_digest, decode_sync_payload, read_sync_body
+from app.schemas import BagCreate, ScannerCreate, SyncBatch
+
+
+def ndjson(batches):
+    return "\n".join(json.dumps(b) for b in batches).encode("utf-8")
+
+
+BATCHES = [
+    {"seq": 1, "scans": [{"bag_id": "a", "scanned_at": "2024-01-01T10:00:00+02:00"}]},
+    {"seq": 2, "scans": [{"bag_id": "b", "scanned_at": "2024-01-01T09:00:00Z", "checkpoint": "LOADING"}]},
+]
+
+
+def test_decode_gzip_ndjson_normalizes_timezones():
+    batches = decode_sync_payload(gzip.compress(ndjson(BATCHES)), "application/x-ndjson", "gzip")
+    assert [b.seq for b in batches] == [1, 2]
+    assert batches[0].scans[0].scanned_at == datetime(2024, 1, 1, 8, 0)
+    assert batches[0].scans[0].scanned_at.tzinfo is None
+    assert batches[1].scans[0].checkpoint == CheckpointStage.LOADING
+
+
+def test_decode_msgpack():
+    batches = decode_sync_payload(msgpack.packb(BATCHES), "application/msgpack")
+    assert [b.seq for b in batches] == [1, 2]
+    assert batches[1].scans[0].scanned_at == datetime(2024, 1, 1, 9, 0)
+
+
+def test_decode_rejects_oversized_gzip(monkeypatch):
+    monkeypatch.setattr(scan_sync, "MAX_SYNC_PAYLOAD_BYTES", 64)
+    body = gzip.compress(ndjson(BATCHES * 10))
+    with pytest.raises(SyncPayloadError, match="too large"):
+        decode_sync_payload(body, "application/x-ndjson", "gzip")
+
+
+def test_decode_rejects_bad_input():
+    with pytest.raises(SyncPayloadError):
+        decode_sync_payload(b"not json", "application/x-ndjson")
+    # high_water_mark counts from 1, so seq 0 could never be acknowledged
+    with pytest.raises(SyncPayloadError):
+        decode_sync_payload(ndjson([{"seq": 0, "scans": []}]), "application/x-ndjson")
+    with pytest.raises(SyncPayloadError):
+        decode_sync_payload(ndjson(BATCHES), "text/xml")
+
+
+def test_body_is_capped_before_buffering(monkeypatch, run):
+    monkeypatch.setattr(scan_sync, "MAX_SYNC_PAYLOAD_BYTES", 64)
+    consumed = []
+
+    async def chunks():
+        for _ in range(100):
+            consumed.append(1)
+            yield b"x" * 16
+
+    with pytest.raises(SyncPayloadError, match="too large"):
+        run(read_sync_body(chunks(), "1600"))
+    assert consumed == []
+    # Without a usable Content-Length the stream is cut off at the cap
+    with pytest.raises(SyncPayloadError, match="too large"):
+        run(read_sync_body(chunks()))
+    assert len(consumed) == 5
+
+
+def test_digest_ignores_scan_order():
+    scans = [
+        {"bag_id": "a", "scanned_at": "2024-01-01T10:00:00"},
+        {"bag_id": "b", "scanned_at": "2024-01-01T11:00:00"},
+    ]
+    forward = SyncBatch.parse_obj({"seq": 1, "scans": scans})
+    backward = SyncBatch.parse_obj({"seq": 1, "scans": scans[::-1]})
+    changed = SyncBatch.parse_obj({"seq": 1, "scans": scans[:1]})
+    assert batch_digest(forward) == batch_digest(backward)
+    assert batch_digest(forward) != batch_digest(changed)
+
+
+def _batch(seq, bag_id, hour):
+    return SyncBatch.parse_obj({"seq": seq, "scans": [{"bag_id": bag_id, "scanned_at": f"2024-01-01T{hour:02d}:00:00"}]})
+
+
+def test_sync_is_idempotent_and_reports_contiguous_high_water_mark(db, run):
+    async def scenario():
+        bag = await crud.create_bag(BagCreate(tag_number="T1"))
+        scanner = await crud.create_scanner(ScannerCreate(name="s", location="Stand 4", checkpoint=CheckpointStage.LOADING))
+
+        first = await crud.apply_sync_batches(scanner, [_batch(1, bag.id, 10), _batch(3, bag.id, 12)])
+        again = await crud.apply_sync_batches(scanner, [_batch(1, bag.id, 10), _batch(2, bag.id, 11)])
+        history = await crud.get_history(bag.id)
+        return first, again, history
+
+    first, again, history = run(scenario())
+    assert first.applied_batches == [1, 3]
+    # seq 2 is missing, so only seq 1 may be dropped by the device
+    assert (first.high_water_mark, first.last_seq) == (1, 3)
+    assert again.duplicate_batches == [1]
+    assert again.applied_batches == [2]
+    assert (again.high_water_mark, again.last_seq) == (3, 3)
+    # replayed batch did not duplicate scans, and history is in capture order
+    assert [h.scanned_at.hour for h in history] == [10, 11, 12]
+    assert all(h.checkpoint == CheckpointStage.LOADING for h in history)
+
+
+def test_reused_seq_with_different_content_conflicts(db, run):
+    async def scenario():
+        bag = await crud.create_bag(BagCreate(tag_number="T1"))
+        scanner = await crud.create_scanner(ScannerCreate(name="s", location="L", checkpoint=CheckpointStage.LOADING))
+        await crud.apply_sync_batches(scanner, [_batch(1, bag.id, 10)])
+        with pytest.raises(SyncConflictError) as exc:
+            await crud.apply_sync_batches(scanner, [_batch(1, bag.id, 11), _batch(2, bag.id, 12)])
+        return exc.value.seqs, await crud.get_history(bag.id), await crud.get_sync_state(scanner.id)
+
+    seqs, history, state = run(scenario())
+    assert seqs == [1]
+    # nothing from the conflicting upload was applied
+    assert len(history) == 1
+    assert state.last_seq == 1
+
+
+def test_unknown_bag_scans_are_kept_as_rejected(db, run):
+    async def scenario():
+        scanner = await crud.create_scanner(ScannerCreate(name="s", location="L", checkpoint=CheckpointStage.LOADING))
+        future = SyncBatch.parse_obj({"seq": 2, "scans": [{"bag_id": "other-bag", "scanned_at": "2999-01-01T00:00:00"}]})
+        result = await crud.apply_sync_batches(scanner, [_batch(1, "missing-bag", 10), future])
+        async with crud.AsyncSessionLocal() as session:
+            rejected = (await session.execute(select(RejectedScan))).scalars().all()
+        return result, rejected
+
+    result, rejected = run(scenario())
+    assert result.rejected_scans == 2
+    assert result.high_water_mark == 2
+    rejected.sort(key=lambda r: r.seq)
+    assert [(r.seq, r.bag_id, r.reason) for r in rejected] == [(1, "missing-bag", "Bag not found"), (2, "other-bag", "Bag not found")]
+    # Device clock drift is clamped as for applied scans
+    assert rejected[1].scanned_at == rejected[1].received_at
+
+
+def test_sync_endpoint_status_codes(db, run):
+    async def scenario():
+        bag = await crud.create_bag(BagCreate(tag_number="T1"))
+        scanner = await crud.create_scanner(ScannerCreate(name="s", location="L", checkpoint=CheckpointStage.LOADING))
+        headers = {"content-type": "application/x-ndjson"}
+        batch = {"seq": 1, "scans": [{"bag_id": bag.id, "scanned_at": "2024-01-01T10:00:00Z"}]}
+        changed = {"seq": 1, "scans": [{"bag_id": bag.id, "scanned_at": "2024-01-01T11:00:00Z"}]}
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            url = f"/scanners/{scanner.id}/sync"
+            ok = await client.post(url, content=ndjson([batch]), headers=headers)
+            state = await client.get(url)
+            conflict = await client.post(url, content=ndjson([changed]), headers=headers)
+            missing = await client.post("/scanners/nope/sync", content=ndjson([batch]), headers=headers)
+        return ok, state, conflict, missing
+
+    ok, state, conflict, missing = run(scenario())
+    assert ok.status_code == 200 and ok.json()["high_water_mark"] == 1
+    assert state.json()["last_seq"] == 1
+    assert conflict.status_code == 409
+    assert conflict.json()["detail"]["conflicting_batches"] == [1]
+    assert missing.status_code == 404
@@ -0,0 +1,105 @@
+import httpx
+import pytest
+
+from app import main
+from app.database import AsyncSessionLocal
+from app.migrate_add_search_indexes import migrate
+from app.models import Bag
+from app.search import decode_cursor, encode_cursor, search_bags
+
+
+def test_cursor_round_trip():
+    cursor = encode_cursor(-1.25, "bag-7")
+    assert decode_cursor(cursor) == (-1.25, "bag-7")
+    with pytest.raises(ValueError):
+        decode_cursor("not-a-cursor")
+
+
+async def seed():
+    await migrate()
+    async with AsyncSessionLocal() as session:
+        # Repeated names give tied scores, so paging must break ties by id
+        for i in range(23):
+            name = ["Anna Smith", "Smithson Lee", "Joe Smithers"][i % 3]
+            session.add(Bag(id=f"bag-{i:02d}", tag_number=f"TAG{i:04d}", passenger_name=name))
+        session.add(Bag(id="other", tag_number="XYZ0001", passenger_name="Maria Lopez"))
+        await session.commit()
+
+
+def test_keyset_pages_have_no_duplicates_or_gaps(db, run):
+    async def scenario():
+        await seed()
+        everything, cursor = await search_bags("smith", limit=100)
+        assert cursor is None
+        paged, cursor = [], None
+        while True:
+            rows, cursor = await search_bags("smith", limit=4, cursor=cursor)
+            paged.extend(rows)
+            if cursor is None:
+                return everything, paged
+
+    everything, paged = run(scenario())
+    assert len(everything) == 23
+    assert [row["id"] for row in paged] == [row["id"] for row in everything]
+    scores = [row["score"] for row in everything]
+    assert scores == sorted(scores, reverse=True)
+
+
+def test_pages_are_stable_when_bags_are_added_between_fetches(db, run):
+    async def scenario():
+        await seed()
+        first, cursor = await search_bags("smith", limit=5)
+        async with AsyncSessionLocal() as session:
+            # Changes table-wide statistics, which bm25 would fold into every score
+            for i in range(50):
+                session.add(Bag(id=f"new-{i:02d}", tag_number=f"NEW{i:04d}", passenger_name="Pat Brown"))
+            await session.commit()
+        rest = []
+        while cursor:
+            rows, cursor = await search_bags("smith", limit=5, cursor=cursor)
+            rest.extend(rows)
+        return [row["id"] for row in first + rest]
+
+    ids = run(scenario())
+    assert len(ids) == len(set(ids)) == 23
+
+
+def test_missing_indexes_return_503(db, run):
+    async def scenario():
+        # No migration run: bag_search does not exist
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.get("/search", params={"q": "smith"})
+
+    response = run(scenario())
+    assert response.status_code == 503
+    assert "migrate_add_search_indexes" in response.json()["detail"]
+
+
+def test_tag_substring_and_padded_short_query(db, run):
+    async def scenario():
+        await seed()
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            hit = await client.get("/search", params={"q": " 0017 "})
+            short = await client.get("/search", params={"q": "  ab  "})
+            return hit, short
+
+    hit, short = run(scenario())
+    assert hit.status_code == 200
+    assert [h["bag"]["id"] for h in hit.json()["hits"]] == ["bag-17"]
+    assert short.status_code == 400
+
+
+def test_unsupported_dialect_is_501(db, run, monkeypatch):
+    async def unsupported(*args):
+        raise NotImplementedError("Search is not supported on mssql")
+
+    monkeypatch.setattr(main, "search_bags", unsupported)
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.get("/search", params={"q": "smith"})
+
+    assert run(scenario()).status_code == 501
@@ -7,7 +7,10 @@ async function request(path, opts = {}) {
   })
   if (!res.ok) {
     const text = await res.text()
-    throw new Error(`${res.status} ${res.statusText} - ${text}`)
+    const error = new Error(`${res.status} ${res.statusText} - ${text}`)
+    error.status = res.status
+    error.body = text
+    throw error
   }
   return res.json().catch(() => null)
 }
@@ -17,6 +20,11 @@ export const api = {
   registerBag: (payload) => request('/registerBag', { method: 'POST', body: JSON.stringify(payload) }),
   scanCheckpoint: (payload) => request('/scanCheckpoint', { method: 'POST', body: JSON.stringify(payload) }),
   getStatus: (bagId) => request(`/getStatus/${encodeURIComponent(bagId)}`),
+  searchBags: (query, cursor, limit = 20) => {
+    const params = new URLSearchParams({ q: query, limit });
+    if (cursor) params.append('cursor', cursor);
+    return request(`/search?${params.toString()}`);
+  },
   // Automation endpoints
   getBagQRCode: (bagId) => `${BASE}/bag/${encodeURIComponent(bagId)}/qr`,
   autoScan: (bagId, scannerId, location) => {
@@ -33,6 +41,19 @@ export const api = {
     if (location) params.append('location', location);
     return request(`/scan/batch?${params.toString()}`, { method: 'POST' });
   },
+  // Offline sync: batches are sent as NDJSON, gzip-compressed when the browser supports it
+  syncScans: async (scannerId, batches) => {
+    const ndjson = batches.map(b => JSON.stringify(b)).join('\n')
+    const headers = { 'Content-Type': 'application/x-ndjson' }
+    let body = ndjson
+    if (typeof CompressionStream !== 'undefined') {
+      const stream = new Blob([ndjson]).stream().pipeThrough(new CompressionStream('gzip'))
+      body = await new Response(stream).arrayBuffer()
+      headers['Content-Encoding'] = 'gzip'
+    }
+    return request(`/scanners/${encodeURIComponent(scannerId)}/sync`, { method: 'POST', headers, body })
+  },
+  getSyncState: (scannerId) => request(`/scanners/${encodeURIComponent(scannerId)}/sync`),
   createScanner: (payload) => request('/scanners', { method: 'POST', body: JSON.stringify(payload) }),
   getScanners: (activeOnly = true) => request(`/scanners?active_only=${activeOnly}`),
   getScanner: (scannerId) => request(`/scanners/${encodeURIComponent(scannerId)}`),
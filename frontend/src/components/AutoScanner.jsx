@@ -2,6 +2,7 @@ import { useState, useEffect, useRef } from 'react'
 import { Html5Qrcode } from 'html5-qrcode'
 import { api } from '../api'
 import { showToast } from '../utils/toast'
+import { queueOfflineScan, alignSeq, getUnsyncedBatches, renumberBatches, acknowledgeBatches } from '../utils/storage'
 
 export default function AutoScanner({ scannerId, onScanComplete }) {
   const [scanning, setScanning] = useState(false)
@@ -22,12 +23,52 @@ export default function AutoScanner({ scannerId, onScanComplete }) {
     }
   }, [scanner])
 
+  // Replay scans buffered while offline, on mount and whenever connectivity returns
+  useEffect(() => {
+    if (!scannerId) return
+
+    async function flushOfflineScans() {
+      try {
+        // Start numbering after whatever the server already holds for this scanner
+        const state = await api.getSyncState(scannerId)
+        alignSeq(scannerId, state.last_seq)
+        const batches = getUnsyncedBatches(scannerId)
+        if (batches.length === 0) return
+        let result
+        try {
+          result = await api.syncScans(scannerId, batches)
+        } catch (error) {
+          if (error.status !== 409) throw error
+          // Seq reused with different content (e.g. another device on this scanner id)
+          const { detail } = JSON.parse(error.body)
+          const latest = await api.getSyncState(scannerId)
+          renumberBatches(scannerId, detail.conflicting_batches, latest.last_seq)
+          result = await api.syncScans(scannerId, getUnsyncedBatches(scannerId))
+        }
+        acknowledgeBatches(scannerId, result.high_water_mark)
+        showToast(`Synced ${result.applied_scans} offline scan(s)`, 'success')
+      } catch (error) {
+        console.error('Offline sync failed:', error)
+      }
+    }
+
+    flushOfflineScans()
+    window.addEventListener('online', flushOfflineScans)
+    return () => window.removeEventListener('online', flushOfflineScans)
+  }, [scannerId])
+
   async function handleScan(bagId) {
     try {
       await api.autoScan(bagId, scannerId, location)
       showToast(`Bag ${bagId} scanned successfully!`, 'success')
       onScanComplete && onScanComplete(bagId)
     } catch (error) {
+      // fetch rejects with TypeError when the network is unreachable
+      if (scannerId && (!navigator.onLine || error instanceof TypeError)) {
+        queueOfflineScan(scannerId, { bag_id: bagId, location: location || null })
+        showToast(`Offline - bag ${bagId} queued for sync`, 'info')
+        return
+      }
       showToast(`Error: ${error.message}`, 'error')
     }
   }
@@ -136,6 +177,7 @@ export default function AutoScanner({ scannerId, onScanComplete }) {
           <li>Connect a barcode scanner (keyboard wedge mode) - just scan!</li>
           <li>Or use camera to scan QR codes</li>
           <li>Checkpoint is automatically determined by scanner location</li>
+          <li>Scans made while offline are queued and synced on reconnect</li>
         </ul>
       </div>
     </div>
@@ -33,4 +33,88 @@ export function removeStoredBag(bagId) {
   } catch (error) {
     console.error('Error removing bag:', error);
   }
-}
\ No newline at end of file
+}
+
+// Offline scan queue: scans captured while the scanner has no connectivity.
+// Each upload groups pending scans into a batch with a per-scanner sequence number
+// so the backend can apply retries idempotently. Sequence numbers must come after
+// the server's last_seq (see alignSeq), otherwise a reused seq is rejected.
+const SCAN_QUEUE_KEY = 'baggage_tracker_scan_queue';
+
+function readScanQueue() {
+  try {
+    const stored = localStorage.getItem(SCAN_QUEUE_KEY);
+    return stored ? JSON.parse(stored) : {};
+  } catch {
+    return {};
+  }
+}
+
+function writeScanQueue(queue) {
+  try {
+    localStorage.setItem(SCAN_QUEUE_KEY, JSON.stringify(queue));
+  } catch (error) {
+    console.error('Error storing scan queue:', error);
+  }
+}
+
+function getEntry(queue, scannerId) {
+  return queue[scannerId] || { nextSeq: 1, pending: [], batches: [] };
+}
+
+export function queueOfflineScan(scannerId, scan) {
+  const queue = readScanQueue();
+  const entry = getEntry(queue, scannerId);
+  entry.pending.push({ ...scan, scanned_at: scan.scanned_at || new Date().toISOString() });
+  queue[scannerId] = entry;
+  writeScanQueue(queue);
+}
+
+// Never number a new batch at or below a seq the server has already recorded
+export function alignSeq(scannerId, lastSeq) {
+  if (lastSeq == null) return;
+  const queue = readScanQueue();
+  const entry = getEntry(queue, scannerId);
+  entry.nextSeq = Math.max(entry.nextSeq, lastSeq + 1);
+  queue[scannerId] = entry;
+  writeScanQueue(queue);
+}
+
+// Seal pending scans into a numbered batch and return every unacknowledged batch.
+// Call alignSeq with the server's sync state first.
+export function getUnsyncedBatches(scannerId) {
+  const queue = readScanQueue();
+  const entry = queue[scannerId];
+  if (!entry) return [];
+  if (entry.pending.length > 0) {
+    entry.batches.push({ seq: entry.nextSeq, scans: entry.pending });
+    entry.nextSeq += 1;
+    entry.pending = [];
+    writeScanQueue(queue);
+  }
+  return entry.batches;
+}
+
+// Give batches whose seq the server already holds with other content a fresh seq
+export function renumberBatches(scannerId, seqs, lastSeq) {
+  const queue = readScanQueue();
+  const entry = queue[scannerId];
+  if (!entry) return;
+  entry.nextSeq = Math.max(entry.nextSeq, (lastSeq ?? 0) + 1);
+  entry.batches.forEach(b => {
+    if (seqs.includes(b.seq)) {
+      b.seq = entry.nextSeq;
+      entry.nextSeq += 1;
+    }
+  });
+  writeScanQueue(queue);
+}
+
+// highWaterMark covers every seq from 1 up to it, so those batches are safe to drop
+export function acknowledgeBatches(scannerId, highWaterMark) {
+  const queue = readScanQueue();
+  const entry = queue[scannerId];
+  if (!entry || highWaterMark == null) return;
+  entry.batches = entry.batches.filter(b => b.seq > highWaterMark);
+  writeScanQueue(queue);
+}